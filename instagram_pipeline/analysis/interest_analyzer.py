@@ -1,39 +1,77 @@
 import os
-import json
+import gzip
 import time
-import psycopg2
+import asyncio
+import shelve
+import hashlib
+import threading
+import itertools
+from pathlib import Path
+from psycopg2.extras import execute_values
 from dotenv import load_dotenv
 import logging
-from openai import OpenAI
+import openai
+from openai import AsyncOpenAI
+import tiktoken
+import orjson
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
 import datetime
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("interest_analyzer.log"),
-        logging.StreamHandler()
-    ]
-)
+from instagram_pipeline.analysis.rate_limiter import RateLimiter
+from instagram_pipeline.config import db_connection, db_cursor
+from instagram_pipeline.database.helpers import COPY_THRESHOLD, copy_upsert
+
 logger = logging.getLogger("InterestAnalyzer")
 
+# GPT-4 results keyed by prompt hash, kept across restarts
+DEFAULT_RESPONSE_CACHE = Path("~/.cache/interest_analyzer/responses.jsonl.gz")
+
+# Interest results keyed by user and a fingerprint of their following list
+DEFAULT_INTEREST_CACHE = Path("~/.cache/interest_analyzer/interests.db")
+
+SYSTEM_PROMPT = (
+    "You are an expert at analyzing Instagram accounts to determine interest categories. "
+    "You must categorize accounts into the provided categories based on username, name, and bio text. "
+    "Return results as a valid JSON array."
+)
+
 class InterestAnalyzer:
-    def __init__(self):
+    def __init__(self, embedding_model="all-MiniLM-L6-v2", response_cache_path=DEFAULT_RESPONSE_CACHE,
+                 interest_cache_path=DEFAULT_INTEREST_CACHE):
         load_dotenv()
-        self.db_conn = self._get_db_connection()
-        self.client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        self.client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        self.response_cache_path = Path(response_cache_path).expanduser() if response_cache_path else None
+        self.interest_cache_path = Path(interest_cache_path).expanduser() if interest_cache_path else None
+        self._interest_cache_lock = threading.Lock()  # The shelve file allows one writer at a time
+        self._response_cache = self._load_response_cache()
+        self.category_cache_ttl = 300  # Seconds before the category mapping is re-read
+        self._category_cache = None
+        self._category_cache_ts = 0
+        self._category_vectors = None
+        self._prompt_prefix = None  # Static start of every batch prompt, rebuilt when categories change
+        self._prompt_prefix_categories = None
+        
+        # Local embedding model used to categorize obvious accounts without GPT-4; loaded on
+        # first use, since importing it pulls in torch and the model is downloaded the first time
+        self.embedding_model = embedding_model
+        self.embedder = None
+        self._embedder_loaded = not embedding_model
+        self._embedder_lock = threading.Lock()  # Chunks are classified from worker threads
+        self.local_confidence_threshold = 0.35  # Minimum cosine similarity to skip GPT-4
+        
         self.setup_interest_categories()
-        self.batch_size = 20  # Process 20 accounts at a time for efficiency
-    
-    def _get_db_connection(self):
-        return psycopg2.connect(
-            host=os.getenv('DB_HOST'),
-            port=os.getenv('DB_PORT'),
-            dbname=os.getenv('DB_NAME'),
-            user=os.getenv('DB_USER'),
-            password=os.getenv('DB_PASSWORD')
-        )
+        self.batch_size = 80  # Accounts per request; amortizes the category list over more accounts
+        self.max_concurrency = 8  # Maximum GPT-4 requests in flight at once
+        self.max_tokens = 3000  # Completion token budget per request
+        self.max_prompt_tokens = 5000  # Keeps prompt + completion inside GPT-4's 8k context
+        self.stream_chunk_size = 800  # Following accounts fetched per streamed chunk
+        self.pending_batch_size = 20  # Pending users fetched per pass of process_pending_users
+        self.max_concurrent_users = 8  # Users analyzed at once; GPT-4 requests are bounded separately
+        self.encoding = None  # Loaded on first use; tiktoken downloads it the first time
+        self._encoding_loaded = False
+        self.rate_limiter = RateLimiter()
+        self._semaphore = None
+        self._semaphore_loop = None
     
     def setup_interest_categories(self):
         """Set up predefined interest categories in the database"""
@@ -61,20 +99,6 @@ class InterestAnalyzer:
             # Subcategories will be added with parent_id references
         ]
         
-        cursor = self.db_conn.cursor()
-        
-        # Insert main categories first
-        for category_name, parent_id, description in categories:
-            cursor.execute("""
-                INSERT INTO interest_categories (category_name, parent_category_id, description)
-                VALUES (%s, %s, %s)
-                ON CONFLICT (category_name) DO UPDATE 
-                SET description = EXCLUDED.description
-                RETURNING category_id
-            """, (category_name, parent_id, description))
-            
-        self.db_conn.commit()
-        
         # Now add subcategories (in a real implementation, we'd add many more)
         subcategories = [
             # Fashion subcategories
@@ -95,41 +119,55 @@ class InterestAnalyzer:
             # Add more subcategories for other main categories
         ]
         
-        # Insert subcategories with parent references
-        for sub_name, parent_name, sub_description in subcategories:
-            # Get parent category ID
-            cursor.execute("SELECT category_id FROM interest_categories WHERE category_name = %s", (parent_name,))
-            parent_id = cursor.fetchone()[0]
+        with db_cursor() as cursor:
+            # Insert main categories first, in a single multi-row statement
+            execute_values(cursor, """
+                INSERT INTO interest_categories (category_name, parent_category_id, description)
+                VALUES %s
+                ON CONFLICT (category_name) DO UPDATE 
+                SET description = EXCLUDED.description
+            """, categories)
             
-            cursor.execute("""
+            # Insert subcategories, resolving parent references in the same statement
+            execute_values(cursor, """
                 INSERT INTO interest_categories (category_name, parent_category_id, description)
-                VALUES (%s, %s, %s)
+                SELECT v.sub_name, p.category_id, v.sub_description
+                FROM (VALUES %s) AS v(sub_name, parent_name, sub_description)
+                JOIN interest_categories p ON p.category_name = v.parent_name
                 ON CONFLICT (category_name) DO UPDATE 
                 SET description = EXCLUDED.description
-                RETURNING category_id
-            """, (sub_name, parent_id, sub_description))
+            """, subcategories, template="(%s, %s, %s)")
         
-        self.db_conn.commit()
+        # Categories changed, so the cached mapping and embeddings are stale
+        self._category_cache = None
+        self._category_vectors = None
         logger.info("Interest categories setup completed")
     
     def get_category_mapping(self):
-        """Get a mapping of category names to IDs"""
-        cursor = self.db_conn.cursor()
-        cursor.execute("SELECT category_id, category_name FROM interest_categories")
-        return {row[1]: row[0] for row in cursor.fetchall()}
+        """Get a mapping of category names to IDs, cached for category_cache_ttl seconds"""
+        if self._category_cache is not None and time.monotonic() - self._category_cache_ts < self.category_cache_ttl:
+            return self._category_cache
+        
+        with db_cursor() as cursor:
+            cursor.execute("SELECT category_id, category_name FROM interest_categories")
+            self._category_cache = {row[1]: row[0] for row in cursor.fetchall()}
+        
+        self._category_cache_ts = time.monotonic()
+        return self._category_cache
     
     def get_following_data_for_user(self, user_id):
         """Get following data for a user to analyze interests"""
-        cursor = self.db_conn.cursor()
-        cursor.execute("""
-            SELECT u.username, u.full_name, u.bio
-            FROM following f
-            JOIN users u ON f.following_id = u.user_id
-            WHERE f.user_id = %s
-        """, (user_id,))
+        with db_cursor() as cursor:
+            cursor.execute("""
+                SELECT u.username, u.full_name, u.bio
+                FROM following f
+                JOIN users u ON f.following_id = u.user_id
+                WHERE f.user_id = %s
+            """, (user_id,))
+            rows = cursor.fetchall()
         
         following_data = []
-        for row in cursor.fetchall():
+        for row in rows:
             following_data.append({
                 "username": row[0],
                 "full_name": row[1],
@@ -138,90 +176,443 @@ class InterestAnalyzer:
         
         return following_data
     
-    def analyze_user_interests(self, username):
+    def iter_following_batches(self, user_id, batch_size=None):
+        """Stream a user's following data in batches through a server-side cursor"""
+        batch_size = batch_size or self.batch_size
+        
+        with db_connection() as conn:
+            cursor = conn.cursor(name=f"follow_{user_id}")
+            cursor.itersize = batch_size
+            cursor.execute("""
+                SELECT u.username, u.full_name, u.bio
+                FROM following f
+                JOIN users u ON f.following_id = u.user_id
+                WHERE f.user_id = %s
+            """, (user_id,))
+            
+            batch = []
+            for row in cursor:
+                batch.append({
+                    "username": row[0],
+                    "full_name": row[1],
+                    "bio": row[2] if row[2] else ""
+                })
+                if len(batch) == batch_size:
+                    yield batch
+                    batch = []
+            
+            if batch:
+                yield batch
+            cursor.close()
+    
+    def _get_semaphore(self):
+        """Get the request semaphore bound to the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+    
+    def analyze_user_interests(self, username, user_id=None, following_data=None):
         """Analyze a user's interests based on their following list"""
+        return asyncio.run(self.analyze_user_interests_async(username, user_id, following_data))
+    
+    async def analyze_user_interests_async(self, username, user_id=None, following_data=None):
+        """Analyze a user's interests, sending all GPT-4 batches concurrently"""
+        # Database, cache file and embedding work runs in worker threads so other users'
+        # analyses keep making progress on the event loop meanwhile
+        chunks = None
+        tasks = []
         try:
-            # Get user ID
-            cursor = self.db_conn.cursor()
-            cursor.execute("SELECT user_id FROM users WHERE username = %s", (username,))
-            result = cursor.fetchone()
-            if not result:
-                logger.error(f"User {username} not found in database")
-                return
+            # Get user ID unless the caller already looked it up
+            if user_id is None:
+                user_id = await asyncio.to_thread(self._get_user_id, username)
+                if user_id is None:
+                    logger.error(f"User {username} not found in database")
+                    return
             
-            user_id = result[0]
+            # Stream following data in chunks unless it was prefetched
+            if following_data is None:
+                chunks = self.iter_following_batches(user_id, self.stream_chunk_size)
+            else:
+                chunks = (
+                    following_data[i:i + self.stream_chunk_size]
+                    for i in range(0, len(following_data), self.stream_chunk_size)
+                )
             
-            # Get following data
-            following_data = self.get_following_data_for_user(user_id)
+            # Get all category names
+            category_mapping = await asyncio.to_thread(self.get_category_mapping)
+            categories_list = list(category_mapping.keys())
+            categories_version = self._categories_version(categories_list)
+            
+            # An unchanged following list gets the interests of the last analysis without categorizing anything
+            fingerprint = await asyncio.to_thread(self._following_fingerprint, user_id, following_data)
+            interest_key = f"{user_id}:{fingerprint}:{categories_version}" if fingerprint else None
+            cached_interests = await asyncio.to_thread(self._get_cached_interests, interest_key)
+            if cached_interests is not None:
+                await asyncio.to_thread(self._store_interest_results, user_id, cached_interests, category_mapping)
+                logger.info(f"Following list of user {username} is unchanged, reused {len(cached_interests)} cached results")
+                return
             
-            if not following_data:
+            account_hashes = {}
+            batch_results = []
+            local_results = []
+            seen_accounts = set()
+            total_accounts = 0
+            while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+                # Drop repeated accounts so each one is only categorized once
+                total_accounts += len(chunk)
+                unique_chunk = []
+                for account in chunk:
+                    key = (account["username"], account["full_name"], account["bio"])
+                    if key not in seen_accounts:
+                        seen_accounts.add(key)
+                        unique_chunk.append(account)
+                chunk = unique_chunk
+                
+                # Reuse categorizations of accounts already seen in other users' follow lists
+                chunk_hashes = {
+                    account["username"]: self._account_hash(account, categories_version)
+                    for account in chunk
+                }
+                account_hashes.update(chunk_hashes)
+                cached_results, chunk = await asyncio.to_thread(
+                    self._split_cached_accounts, chunk, chunk_hashes, category_mapping
+                )
+                batch_results.extend(cached_results)
+                
+                # Categorize accounts that clearly match a category description locally
+                chunk_local_results, chunk = await asyncio.to_thread(self._classify_locally, chunk)
+                local_results.extend(chunk_local_results)
+                
+                # Start GPT-4 requests for this chunk before the next one is fetched; prompts
+                # that exceed the token budget are split further
+                for i in range(0, len(chunk), self.batch_size):
+                    for batch, prompt in self._split_batch(chunk[i:i + self.batch_size], categories_list):
+                        tasks.append(asyncio.create_task(self._run_batch(batch, prompt, username, len(tasks))))
+            
+            if not total_accounts:
                 logger.warning(f"No following data found for user {username}")
                 return
             
-            # Get all category names
-            category_mapping = self.get_category_mapping()
-            categories_list = list(category_mapping.keys())
+            dedup_ratio = 1 - len(seen_accounts) / total_accounts
+            logger.info(f"Deduplicated {total_accounts} following accounts to {len(seen_accounts)} ({dedup_ratio:.1%} removed) for user {username}")
+            logger.info(f"Found {len(batch_results)} cached categorizations for user {username}")
+            if local_results:
+                logger.info(f"Categorized {len(local_results)} accounts locally for user {username}")
             
-            # Process following data in batches for efficiency
-            total_processed = 0
-            batch_results = []
+            # The semaphore bounds how many batches are in flight
+            outcomes = await asyncio.gather(*tasks, return_exceptions=True)
             
-            # Create batches of following data
-            batches = [following_data[i:i + self.batch_size] for i in range(0, len(following_data), self.batch_size)]
+            new_results = list(local_results)
+            failed = False
+            for batch_idx, outcome in enumerate(outcomes):
+                if isinstance(outcome, Exception):
+                    logger.error(f"Error processing batch {batch_idx+1} with GPT-4: {str(outcome)}")
+                    failed = True
+                else:
+                    new_results.extend(outcome)
             
-            for batch_idx, batch in enumerate(batches):
-                logger.info(f"Processing batch {batch_idx+1}/{len(batches)} for user {username}")
-                
-                # Create a prompt for GPT-4
-                prompt = self._create_batch_prompt(batch, categories_list)
-                
-                # Send to GPT-4 and process response
-                try:
-                    response = self.client.chat.completions.create(
-                        model="gpt-4",
-                        messages=[
-                            {"role": "system", "content": "You are an expert at analyzing Instagram accounts to determine interest categories. You must categorize accounts into the provided categories based on username, name, and bio text. Return results as a valid JSON array."},
-                            {"role": "user", "content": prompt}
-                        ],
-                        temperature=0.2,
-                        max_tokens=2000,
-                        response_format={"type": "json_object"}
-                    )
-                    
-                    # Extract and parse the result
-                    result_json = json.loads(response.choices[0].message.content)
-                    
-                    if "results" in result_json:
-                        batch_results.extend(result_json["results"])
-                        total_processed += len(batch)
-                        logger.info(f"Successfully processed {len(batch)} accounts for user {username}")
-                    else:
-                        logger.error(f"Invalid response format from GPT-4 for batch {batch_idx+1}")
-                    
-                    # Avoid rate limits
-                    time.sleep(1)
-                    
-                except Exception as e:
-                    logger.error(f"Error processing batch {batch_idx+1} with GPT-4: {str(e)}")
+            if new_results:
+                await asyncio.to_thread(self._cache_categorizations, new_results, account_hashes, category_mapping)
+            batch_results.extend(new_results)
             
             # Process and store the interest analysis results
             if batch_results:
-                self._store_interest_results(user_id, batch_results, category_mapping)
+                await asyncio.to_thread(self._store_interest_results, user_id, batch_results, category_mapping)
                 logger.info(f"Successfully analyzed and stored interests for user {username}")
+                
+                # Only complete analyses are reused, so a failed batch is retried next time
+                if interest_key and not failed:
+                    await asyncio.to_thread(self._save_cached_interests, interest_key, batch_results)
             else:
                 logger.warning(f"No interest results generated for user {username}")
             
         except Exception as e:
             logger.error(f"Error analyzing interests for user {username}: {str(e)}")
+        finally:
+            # Batches started before a failure would otherwise keep spending GPT-4 quota unobserved
+            pending = [task for task in tasks if not task.done()]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if chunks is not None:
+                chunks.close()
     
-    def _create_batch_prompt(self, batch, categories_list):
-        """Create a prompt for processing a batch of following accounts"""
-        categories_str = ", ".join(categories_list)
+    def _get_user_id(self, username):
+        """Look up a user's ID by username, or None when the user is unknown"""
+        with db_cursor() as cursor:
+            cursor.execute("SELECT user_id FROM users WHERE username = %s", (username,))
+            result = cursor.fetchone()
+        return result[0] if result else None
+    
+    def _get_embedder(self):
+        """Load the local embedding model on first use, or return None to use GPT-4 for everything"""
+        with self._embedder_lock:
+            if not self._embedder_loaded:
+                self._embedder_loaded = True
+                try:
+                    from sentence_transformers import SentenceTransformer
+                    self.embedder = SentenceTransformer(self.embedding_model)
+                except ImportError:  # Optional; without it every uncached account goes to GPT-4
+                    logger.info("sentence-transformers not installed, using GPT-4 for all categorization")
+                except Exception as e:
+                    logger.warning(f"Could not load embedding model {self.embedding_model}, using GPT-4 for all categorization: {str(e)}")
+        return self.embedder
+    
+    def _get_category_vectors(self):
+        """Get category names and normalized embeddings of their descriptions"""
+        if self._category_vectors is None:
+            with db_cursor() as cursor:
+                cursor.execute("SELECT category_name, description FROM interest_categories ORDER BY category_id")
+                rows = cursor.fetchall()
+            
+            names = [row[0] for row in rows]
+            texts = [f"{row[0]}: {row[1] or ''}" for row in rows]
+            self._category_vectors = (names, self.embedder.encode(texts, normalize_embeddings=True))
+        
+        return self._category_vectors
+    
+    def _classify_locally(self, accounts):
+        """Match accounts to the nearest category embedding, returning results and the unmatched accounts"""
+        if not accounts or self._get_embedder() is None:
+            return [], accounts
+        
+        names, category_vectors = self._get_category_vectors()
+        texts = [f"{a['username']} {a['full_name'] or ''} {a['bio'] or ''}" for a in accounts]
+        account_vectors = self.embedder.encode(texts, batch_size=64, normalize_embeddings=True)
+        
+        # Vectors are normalized, so the dot product is the cosine similarity
+        similarities = account_vectors @ category_vectors.T
+        best_categories = similarities.argmax(axis=1)
+        best_scores = similarities.max(axis=1)
+        
+        results = []
+        remaining = []
+        for account, category_idx, score in zip(accounts, best_categories, best_scores):
+            if score >= self.local_confidence_threshold:
+                results.append({
+                    "username": account["username"],
+                    "category": names[category_idx],
+                    "confidence": float(score)
+                })
+            else:
+                remaining.append(account)
+        
+        return results, remaining
+    
+    def _categories_version(self, categories_list):
+        """Fingerprint the category list so cached categorizations expire when it changes"""
+        return hashlib.sha256("|".join(sorted(categories_list)).encode("utf-8")).hexdigest()
+    
+    def _following_fingerprint(self, user_id, following_data=None):
+        """Fingerprint the content of a user's following list, or None when it is empty"""
+        if following_data is not None:
+            entries = sorted(
+                "\x1f".join((account["username"] or "", account["full_name"] or "", account["bio"] or ""))
+                for account in following_data
+            )
+            return hashlib.md5("\x1e".join(entries).encode("utf-8")).hexdigest() if entries else None
+        
+        # Same digest computed in the database, so a streamed list isn't fetched just to fingerprint it
+        with db_cursor() as cursor:
+            cursor.execute("""
+                SELECT md5(string_agg(entry, E'\\x1e' ORDER BY entry COLLATE "C"))
+                FROM (
+                    SELECT concat(u.username, E'\\x1f', u.full_name, E'\\x1f', u.bio) AS entry
+                    FROM following f
+                    JOIN users u ON f.following_id = u.user_id
+                    WHERE f.user_id = %s
+                ) entries
+            """, (user_id,))
+            return cursor.fetchone()[0]
+    
+    def _get_cached_interests(self, key):
+        """Look up the results of an earlier analysis of the same following list"""
+        if not self.interest_cache_path or not key:
+            return None
+        
+        self.interest_cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._interest_cache_lock, shelve.open(str(self.interest_cache_path)) as cache:
+            return cache.get(key)
+    
+    def _save_cached_interests(self, key, results):
+        """Remember the results of an analysis for the next run over the same following list"""
+        if not self.interest_cache_path:
+            return
+        
+        self.interest_cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._interest_cache_lock, shelve.open(str(self.interest_cache_path)) as cache:
+            cache[key] = results
+    
+    def _account_hash(self, account, categories_version):
+        """Hash the account content that GPT-4 bases its categorization on"""
+        content = "|".join([
+            account["username"] or "",
+            account["full_name"] or "",
+            account["bio"] or "",
+            categories_version
+        ])
+        return hashlib.sha256(content.encode("utf-8")).digest()
+    
+    def _split_cached_accounts(self, following_data, account_hashes, category_mapping):
+        """Split following data into cached results and accounts that still need GPT-4"""
+        with db_cursor() as cursor:
+            cursor.execute("""
+                SELECT content_hash, category_id, confidence
+                FROM account_categorization_cache
+                WHERE content_hash = ANY(%s)
+            """, (list(set(account_hashes.values())),))
+            cached = {bytes(row[0]): (row[1], row[2]) for row in cursor.fetchall()}
+        
+        category_names = {category_id: name for name, category_id in category_mapping.items()}
+        
+        cached_results = []
+        uncached_accounts = []
+        for account in following_data:
+            hit = cached.get(account_hashes[account["username"]])
+            if hit and hit[0] in category_names:
+                cached_results.append({
+                    "username": account["username"],
+                    "category": category_names[hit[0]],
+                    "confidence": hit[1]
+                })
+            else:
+                uncached_accounts.append(account)
+        
+        return cached_results, uncached_accounts
+    
+    def _cache_categorizations(self, results, account_hashes, category_mapping):
+        """Store new GPT-4 categorizations keyed by account content hash"""
+        rows = []
+        for result in results:
+            content_hash = account_hashes.get(result.get("username"))
+            category_id = category_mapping.get(result.get("category"))
+            if content_hash is None or category_id is None:
+                continue
+            rows.append((content_hash, category_id, result.get("confidence", 0.5)))
         
-        prompt = f"""
+        if not rows:
+            return
+        
+        with db_cursor() as cursor:
+            if len(rows) > COPY_THRESHOLD:
+                copy_upsert(cursor, "account_categorization_cache", ("content_hash", "category_id", "confidence"),
+                            rows, "ON CONFLICT (content_hash) DO NOTHING")
+                return
+            
+            execute_values(cursor, """
+                INSERT INTO account_categorization_cache (content_hash, category_id, confidence)
+                VALUES %s
+                ON CONFLICT (content_hash) DO NOTHING
+            """, rows)
+    
+    def _count_tokens(self, text):
+        """Count the GPT-4 tokens in a piece of text"""
+        if not self._encoding_loaded:
+            self._encoding_loaded = True
+            try:
+                self.encoding = tiktoken.encoding_for_model("gpt-4")
+            except Exception as e:
+                logger.warning(f"Could not load the GPT-4 tokenizer, estimating token counts: {str(e)}")
+        
+        if self.encoding is None:
+            # Roughly four characters per token for English text
+            return len(text) // 4
+        return len(self.encoding.encode(text))
+    
+    def _split_batch(self, batch, categories_list):
+        """Build the prompt for a batch, halving the batch until the prompt fits the token budget"""
+        prompt = self._create_batch_prompt(batch, categories_list)
+        if len(batch) == 1 or self._count_tokens(prompt) <= self.max_prompt_tokens:
+            return [(batch, prompt)]
+        
+        middle = len(batch) // 2
+        return self._split_batch(batch[:middle], categories_list) + self._split_batch(batch[middle:], categories_list)
+    
+    def _load_response_cache(self):
+        """Load cached GPT-4 results from the gzipped JSON Lines file"""
+        cache = {}
+        if not self.response_cache_path or not self.response_cache_path.exists():
+            return cache
+        
+        try:
+            with gzip.open(self.response_cache_path, "rb") as f:
+                for line in f:
+                    entry = orjson.loads(line)
+                    cache[entry["key"]] = entry["results"]
+        except (OSError, EOFError, ValueError, KeyError) as e:
+            # A write interrupted by a crash leaves a truncated tail; keep what was read
+            logger.warning(f"Stopped reading response cache at a damaged entry: {str(e)}")
+        
+        logger.info(f"Loaded {len(cache)} cached GPT-4 responses")
+        return cache
+    
+    def _save_response(self, key, results):
+        """Remember a GPT-4 result in memory and append it to the cache file"""
+        self._response_cache[key] = results
+        if not self.response_cache_path:
+            return
+        
+        self.response_cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with gzip.open(self.response_cache_path, "ab") as f:
+            f.write(orjson.dumps({"key": key, "results": results}) + b"\n")
+    
+    async def _run_batch(self, batch, prompt, username, batch_idx):
+        """Send one batch of following accounts to GPT-4 and return its results"""
+        # Replay the stored result if this exact prompt was answered before
+        key = hashlib.sha256(prompt.encode()).hexdigest()
+        if key in self._response_cache:
+            logger.info(f"Using cached GPT-4 response for batch {batch_idx+1} of user {username}")
+            return self._response_cache[key]
+        
+        async with self._get_semaphore():
+            logger.info(f"Processing batch {batch_idx+1} for user {username}")
+            response = await self._create_completion(prompt)
+        
+        # Extract and parse the result
+        result_json = orjson.loads(response.choices[0].message.content)
+        
+        if "results" not in result_json:
+            logger.error(f"Invalid response format from GPT-4 for batch {batch_idx+1}")
+            return []
+        
+        self._save_response(key, result_json["results"])
+        logger.info(f"Successfully processed {len(batch)} accounts for user {username}")
+        return result_json["results"]
+    
+    @retry(
+        wait=wait_random_exponential(min=1, max=60),
+        stop=stop_after_attempt(6),
+        retry=retry_if_exception_type(openai.RateLimitError),
+        reraise=True
+    )
+    async def _create_completion(self, prompt):
+        """Call GPT-4 once the rate limiter has quota, retrying on rate limit errors"""
+        await self.rate_limiter.acquire(estimated_tokens=self._count_tokens(prompt) + self.max_tokens)
+        
+        raw_response = await self.client.chat.completions.with_raw_response.create(
+            model="gpt-4",
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.2,
+            max_tokens=self.max_tokens,
+            response_format={"type": "json_object"}
+        )
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        
+        return raw_response.parse()
+    
+    def _get_prompt_prefix(self, categories_list):
+        """Get the static start of the batch prompt, shared by every batch so the API can cache it"""
+        categories = tuple(categories_list)
+        if self._prompt_prefix_categories != categories:
+            self._prompt_prefix = f"""
         I need you to analyze the following Instagram accounts and determine which interest categories they fall into.
         
-        The available categories are: {categories_str}
+        The available categories are: {", ".join(categories)}
         
         For each account, return:
         1. The account username
@@ -230,91 +621,121 @@ class InterestAnalyzer:
         
         Here are the accounts to analyze:
         """
+            self._prompt_prefix_categories = categories
         
-        for account in batch:
-            prompt += f"\n---\nUsername: {account['username']}\n"
-            prompt += f"Name: {account['full_name']}\n"
-            prompt += f"Bio: {account['bio']}\n"
+        return self._prompt_prefix
+    
+    def _create_batch_prompt(self, batch, categories_list):
+        """Create a prompt for processing a batch of following accounts"""
+        accounts = "".join(
+            f"\n{number}. Username: {account['username']}\nName: {account['full_name']}\nBio: {account['bio']}\n"
+            for number, account in enumerate(batch, start=1)
+        )
         
-        prompt += """
-        Return your analysis in a valid JSON format as follows:
-        {
+        return self._get_prompt_prefix(categories_list) + accounts + f"""
+        Return your analysis in a valid JSON format as follows, with exactly {len(batch)} entries in "results", one per numbered account:
+        {{
           "results": [
-            {
+            {{
               "username": "username1",
               "category": "Category",
               "confidence": 0.9
-            },
+            }},
             ...
           ]
-        }
+        }}
         
         Remember, use ONLY the categories provided in the list.
         """
-        
-        return prompt
     
     def _store_interest_results(self, user_id, results, category_mapping):
         """Store the interest analysis results in the database"""
-        cursor = self.db_conn.cursor()
+        # Skip results whose category doesn't match our predefined categories
+        known = [result for result in results if result.get("category") in category_mapping]
+        if len(known) < len(results):
+            unknown = {str(result.get("category")) for result in results} - category_mapping.keys()
+            logger.warning(f"Skipped {len(results) - len(known)} results with categories not found in predefined categories: {', '.join(sorted(unknown))}")
         
-        # Process each result and update interests table
-        for result in results:
-            username = result.get("username")
-            category = result.get("category")
-            confidence = result.get("confidence", 0.5)
-            
-            # Skip if category doesn't match our predefined categories
-            if category not in category_mapping:
-                logger.warning(f"Category '{category}' for {username} not found in predefined categories")
-                continue
-            
-            category_id = category_mapping[category]
-            
-            # Insert interest record
-            cursor.execute("""
+        # Collect one row per category; a later result for the same category wins
+        confidences = {category_mapping[result["category"]]: result.get("confidence", 0.5) for result in known}
+        rows = {category_id: (user_id, category_id, confidence) for category_id, confidence in confidences.items()}
+        
+        if not rows:
+            return
+        
+        # Insert all interest records in a single statement; there is at most one row per category
+        with db_cursor() as cursor:
+            execute_values(cursor, """
                 INSERT INTO interests (user_id, category_id, confidence_score)
-                VALUES (%s, %s, %s)
+                VALUES %s
                 ON CONFLICT (user_id, category_id) 
                 DO UPDATE SET confidence_score = EXCLUDED.confidence_score, created_at = CURRENT_TIMESTAMP
-            """, (user_id, category_id, confidence))
+            """, list(rows.values()))
         
-        self.db_conn.commit()
         logger.info(f"Stored {len(results)} interest results for user {user_id}")
     
     def process_pending_users(self):
         """Process users who have complete following data but no interest analysis"""
+        return asyncio.run(self.process_pending_users_async())
+    
+    async def process_pending_users_async(self):
+        """Analyze pending users concurrently and return how many were processed"""
+        # Bounds the users in flight; the request semaphore and rate limiter bound GPT-4 usage
+        user_semaphore = asyncio.Semaphore(self.max_concurrent_users)
+        
+        async def analyze(username, user_id, following_data):
+            async with user_semaphore:
+                await self.analyze_user_interests_async(username, user_id=user_id, following_data=following_data)
+        
         try:
-            cursor = self.db_conn.cursor()
-            
-            # Find users who have completed following data but no interest analysis
-            cursor.execute("""
-                SELECT u.username
-                FROM users u
-                JOIN scrape_jobs sj ON u.username = sj.target_username AND sj.job_type = 'following' AND sj.status = 'completed'
-                LEFT JOIN interests i ON u.user_id = i.user_id
-                WHERE i.id IS NULL
-                LIMIT 5  -- Process 5 users at a time
-            """)
-            
-            users = cursor.fetchall()
+            tasks = []
+            with db_connection() as conn:
+                # Fetch pending users together with their following lists in one query,
+                # streamed through a server-side cursor instead of one JOIN per user
+                cursor = conn.cursor(name="pending_stream")
+                cursor.itersize = 2000
+                cursor.execute("""
+                    WITH pending AS (
+                        SELECT DISTINCT u.user_id, u.username
+                        FROM users u
+                        JOIN scrape_jobs sj ON u.username = sj.target_username AND sj.job_type = 'following' AND sj.status = 'completed'
+                        LEFT JOIN interests i ON u.user_id = i.user_id
+                        WHERE i.id IS NULL
+                        ORDER BY u.user_id
+                        LIMIT %s
+                    )
+                    SELECT p.user_id, p.username, u2.username, u2.full_name, u2.bio
+                    FROM pending p
+                    JOIN following f ON p.user_id = f.user_id
+                    JOIN users u2 ON f.following_id = u2.user_id
+                    ORDER BY p.user_id
+                """, (self.pending_batch_size,))
+                
+                # Rows arrive ordered by user, so each group is one user's following list
+                for (user_id, username), rows in itertools.groupby(cursor, key=lambda row: (row[0], row[1])):
+                    following_data = [
+                        {"username": row[2], "full_name": row[3], "bio": row[4] if row[4] else ""}
+                        for row in rows
+                    ]
+                    logger.info(f"Processing interest analysis for user: {username}")
+                    tasks.append(analyze(username, user_id, following_data))
+                
+                cursor.close()
             
-            if not users:
+            if not tasks:
                 logger.info("No pending users for interest analysis")
-                return
-            
-            for user_row in users:
-                username = user_row[0]
-                logger.info(f"Processing interest analysis for user: {username}")
-                self.analyze_user_interests(username)
-                time.sleep(5)  # Add delay between users
+                return 0
             
-            logger.info(f"Completed interest analysis for {len(users)} users")
+            await asyncio.gather(*tasks)
+            logger.info(f"Completed interest analysis for {len(tasks)} users")
+            return len(tasks)
             
         except Exception as e:
             logger.error(f"Error processing pending users for interest analysis: {str(e)}")
+            return 0
     
     def cleanup(self):
         """Clean up resources"""
-        if self.db_conn:
-            self.db_conn.close()
\ No newline at end of file
+        # Database connections are borrowed from the shared pool per query, so
+        # there is nothing to close here; the pool owner closes the pool
+        pass
\ No newline at end of file
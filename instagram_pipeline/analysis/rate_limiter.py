@@ -0,0 +1,75 @@
+import re
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger("RateLimiter")
+
+# Matches the pieces of OpenAI reset durations such as "6m0s", "1.5s" or "20ms"
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_UNIT_SECONDS = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+
+
+def parse_reset_duration(value):
+    """Convert an x-ratelimit-reset-* header value to seconds"""
+    if not value:
+        return 0.0
+    return sum(float(amount) * _UNIT_SECONDS[unit] for amount, unit in _DURATION_PART.findall(value))
+
+
+class RateLimiter:
+    """Token bucket that mirrors the request/token quota OpenAI reports in its response headers"""
+
+    def __init__(self, requests_per_minute=500, tokens_per_minute=10000):
+        self.request_limit = requests_per_minute
+        self.token_limit = tokens_per_minute
+        self.available_requests = requests_per_minute
+        self.available_tokens = tokens_per_minute
+        self.requests_reset_at = 0.0
+        self.tokens_reset_at = 0.0
+
+    def _refill(self, now):
+        """Restore the full quota once a reset window has passed"""
+        if now >= self.requests_reset_at:
+            self.available_requests = self.request_limit
+        if now >= self.tokens_reset_at:
+            self.available_tokens = self.token_limit
+
+    async def acquire(self, estimated_tokens):
+        """Wait until the quota can cover one request of about estimated_tokens"""
+        # Never wait for more tokens than a full window can provide
+        needed_tokens = min(estimated_tokens, self.token_limit)
+
+        while True:
+            now = time.monotonic()
+            self._refill(now)
+
+            if self.available_requests >= 1 and self.available_tokens >= needed_tokens:
+                self.available_requests -= 1
+                self.available_tokens -= estimated_tokens
+                return
+
+            if self.available_requests < 1:
+                wait = self.requests_reset_at - now
+            else:
+                wait = self.tokens_reset_at - now
+            wait = max(wait, 0.05)
+
+            logger.debug(f"Rate limit bucket empty, waiting {wait:.2f} seconds")
+            await asyncio.sleep(wait)
+
+    def update_from_headers(self, headers):
+        """Sync the bucket with the x-ratelimit-* headers of a response"""
+        now = time.monotonic()
+
+        if headers.get("x-ratelimit-limit-requests"):
+            self.request_limit = int(headers["x-ratelimit-limit-requests"])
+        if headers.get("x-ratelimit-limit-tokens"):
+            self.token_limit = int(headers["x-ratelimit-limit-tokens"])
+
+        if headers.get("x-ratelimit-remaining-requests"):
+            self.available_requests = int(headers["x-ratelimit-remaining-requests"])
+            self.requests_reset_at = now + parse_reset_duration(headers.get("x-ratelimit-reset-requests"))
+        if headers.get("x-ratelimit-remaining-tokens"):
+            self.available_tokens = int(headers["x-ratelimit-remaining-tokens"])
+            self.tokens_reset_at = now + parse_reset_duration(headers.get("x-ratelimit-reset-tokens"))
@@ -1,10 +1,23 @@
 import os
+import queue
+import atexit
+import logging
+import logging.handlers
+import threading
+from contextlib import contextmanager
 import psycopg2
+import redis
+from psycopg2.pool import ThreadedConnectionPool
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+_db_pool = None
+_db_pool_lock = threading.Lock()
+_redis_client = None
+_log_listener = None
+
 def get_db_connection():
     """Get a connection to the PostgreSQL database"""
     return psycopg2.connect(
@@ -15,6 +28,84 @@ def get_db_connection():
         password=os.getenv('DB_PASSWORD')
     )
 
+def get_db_pool():
+    """Get the shared PostgreSQL connection pool, creating it on first use"""
+    global _db_pool
+    with _db_pool_lock:
+        if _db_pool is None:
+            _db_pool = ThreadedConnectionPool(
+                minconn=2,
+                maxconn=16,
+                host=os.getenv('DB_HOST'),
+                port=os.getenv('DB_PORT'),
+                dbname=os.getenv('DB_NAME'),
+                user=os.getenv('DB_USER'),
+                password=os.getenv('DB_PASSWORD')
+            )
+        return _db_pool
+
+def close_db_pool():
+    """Close every connection in the shared pool"""
+    global _db_pool
+    with _db_pool_lock:
+        if _db_pool is not None:
+            _db_pool.closeall()
+            _db_pool = None
+
+@contextmanager
+def db_connection(pool=None):
+    """Borrow a pooled connection, committing on success and rolling back on error"""
+    pool = pool or get_db_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        # Drop connections that died so the pool reconnects instead of handing them out again
+        pool.putconn(conn, close=bool(conn.closed))
+
+@contextmanager
+def db_cursor(pool=None):
+    """Borrow a pooled connection and yield a cursor on it"""
+    with db_connection(pool) as conn:
+        cursor = conn.cursor()
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+
+def get_redis_client():
+    """Get the shared Redis client, or None when REDIS_URL is not configured"""
+    global _redis_client
+    if _redis_client is None and os.getenv('REDIS_URL'):
+        _redis_client = redis.Redis.from_url(os.getenv('REDIS_URL'), decode_responses=True)
+    return _redis_client
+
+def setup_logging(log_file="instagram_pipeline.log", level=logging.INFO):
+    """Send log records through a queue to file and console handlers running on a background thread"""
+    global _log_listener
+    if _log_listener is not None:
+        return
+    
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    handlers = [logging.FileHandler(log_file), logging.StreamHandler()]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    
+    # Logging calls only enqueue the record; the listener thread does the file and console I/O
+    log_queue = queue.Queue(-1)
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    
+    _log_listener = logging.handlers.QueueListener(log_queue, *handlers)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+
 def get_instagram_credentials():
     """Get Instagram login credentials"""
     return {
@@ -28,4 +119,8 @@ def get_openai_api_key():
 
 def get_proxy_api_key():
     """Get proxy service API key"""
-    return os.getenv('PROXY_SERVICE_API')
\ No newline at end of file
+    return os.getenv('PROXY_SERVICE_API')
+
+def get_proxy_urls():
+    """Get the configured proxy URLs; empty when scraping should connect directly"""
+    return [url.strip() for url in os.getenv('PROXY_URLS', '').split(',') if url.strip()]
\ No newline at end of file
@@ -0,0 +1,50 @@
+import io
+import csv
+import weakref
+
+# Below this many rows a multi-row INSERT is cheaper than setting up a COPY
+COPY_THRESHOLD = 200
+
+# Names of the statements already prepared on each connection
+_prepared_statements = weakref.WeakKeyDictionary()
+
+
+def _csv_value(value):
+    """Format a value for COPY's CSV input"""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return "\\x" + bytes(value).hex()
+    return value
+
+
+def copy_upsert(cursor, table, columns, rows, conflict_sql):
+    """Bulk load rows into table through a COPY staging table, resolving conflicts with conflict_sql"""
+    column_list = ", ".join(columns)
+    staging = f"{table}_staging"
+
+    # Temporary staging table mirrors the target columns and vanishes at commit
+    cursor.execute(f"""
+        CREATE TEMP TABLE IF NOT EXISTS {staging}
+        (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP
+    """)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([_csv_value(value) for value in row])
+    buffer.seek(0)
+
+    cursor.copy_expert(f"COPY {staging} ({column_list}) FROM STDIN WITH (FORMAT csv)", buffer)
+    cursor.execute(f"""
+        INSERT INTO {table} ({column_list})
+        SELECT {column_list} FROM {staging}
+        {conflict_sql}
+    """)
+    cursor.execute(f"TRUNCATE {staging}")
+
+
+def prepare_statement(cursor, name, sql):
+    """PREPARE sql as name on the cursor's connection unless that connection already has it"""
+    prepared = _prepared_statements.setdefault(cursor.connection, set())
+    if name not in prepared:
+        cursor.execute(f"PREPARE {name} AS {sql}")
+        prepared.add(name)
\ No newline at end of file
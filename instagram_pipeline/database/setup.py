@@ -5,7 +5,13 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# Databases whose schema this process has already created, so repeated setup skips every connection
+_ready_databases = set()
+
 def create_database():
+    if os.getenv('DB_NAME') in _ready_databases:
+        return
+    
     # Connect to PostgreSQL
     conn = psycopg2.connect(
         host=os.getenv('DB_HOST'),
@@ -25,6 +31,9 @@ def create_database():
     conn.close()
 
 def create_tables():
+    if os.getenv('DB_NAME') in _ready_databases:
+        return
+    
     # Connect to our database
     conn = psycopg2.connect(
         host=os.getenv('DB_HOST'),
@@ -106,6 +115,16 @@ def create_tables():
     );
     """)
     
+    # Create account categorization cache so each account is only sent to GPT-4 once
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS account_categorization_cache (
+        content_hash BYTEA PRIMARY KEY,
+        category_id INT REFERENCES interest_categories(category_id),
+        confidence FLOAT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """)
+    
     # Create scrape_jobs table for tracking scraping progress
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS scrape_jobs (
@@ -122,9 +141,22 @@ def create_tables():
     );
     """)
     
+    # Index job lookups by user/type/status and the queue of pending jobs
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_jobs_lookup ON scrape_jobs(target_username, job_type, status);
+    CREATE INDEX IF NOT EXISTS idx_jobs_status ON scrape_jobs(status, job_id) WHERE status = 'pending';
+    """)
+    
+    # Index username lookups; the relationship and interest tables are already indexed
+    # on user_id by their UNIQUE(user_id, ...) constraints
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
+    """)
+
     conn.commit()
     cursor.close()
     conn.close()
+    _ready_databases.add(os.getenv('DB_NAME'))
 
 if __name__ == "__main__":
     create_database()
@@ -1,44 +1,29 @@
 import schedule
 import time
 import random
-import psycopg2
-import os
+import select
 from dotenv import load_dotenv
 import logging
 from datetime import datetime, timedelta
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from psycopg2.extras import execute_batch
 
 # Import the scraper
-from scraper.instagram_scraper import InstagramScraper
+from instagram_pipeline.scraper.instagram_scraper import InstagramScraper
+from instagram_pipeline.config import db_cursor, get_db_connection, setup_logging
+from instagram_pipeline.database.helpers import prepare_statement
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("scheduler.log"),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger("JobScheduler")
 
 class JobScheduler:
-    def __init__(self):
+    def __init__(self, daily_quota=200):
         load_dotenv()
-        self.db_conn = self._get_db_connection()
-        self.scraper = InstagramScraper(self.db_conn)
-        self.daily_quota = 200  # Maximum profiles to process per day
+        self.scraper = InstagramScraper()
+        self.listen_conn = None  # Opened by run_scheduler to receive job notifications
+        self.daily_quota = daily_quota  # Maximum profiles to process per day
         self.current_day_processed = 0
         self.last_day = datetime.now().day
     
-    def _get_db_connection(self):
-        return psycopg2.connect(
-            host=os.getenv('DB_HOST'),
-            port=os.getenv('DB_PORT'),
-            dbname=os.getenv('DB_NAME'),
-            user=os.getenv('DB_USER'),
-            password=os.getenv('DB_PASSWORD')
-        )
-    
     def _reset_daily_counter(self):
         """Reset daily counter if it's a new day"""
         current_day = datetime.now().day
@@ -49,26 +34,28 @@ class JobScheduler:
     def schedule_user_scraping(self, username):
         """Add a user to the scraping queue"""
         try:
-            cursor = self.db_conn.cursor()
-            
-            # Check if user is already in queue or completed recently
-            cursor.execute("""
-                SELECT status FROM scrape_jobs 
-                WHERE target_username = %s AND job_type IN ('profile', 'followers', 'following') 
-                AND started_at > %s
-            """, (username, datetime.now() - timedelta(days=7)))
-            
-            recent_jobs = cursor.fetchall()
-            
-            if not recent_jobs:
-                # Schedule jobs for this user
-                for job_type in ['profile', 'followers', 'following']:
-                    cursor.execute("""
-                        INSERT INTO scrape_jobs (target_username, job_type, status)
-                        VALUES (%s, %s, 'pending')
-                    """, (username, job_type))
+            with db_cursor() as cursor:
+                # Insert the jobs only if the user is not already queued or scraped recently
+                cursor.execute("""
+                    WITH recent AS (
+                        SELECT 1 FROM scrape_jobs
+                        WHERE target_username = %s AND job_type IN ('profile', 'followers', 'following')
+                        AND (status = 'pending' OR started_at > %s)
+                    )
+                    INSERT INTO scrape_jobs (target_username, job_type, status)
+                    SELECT %s, job_type, 'pending'
+                    FROM unnest(ARRAY['profile', 'followers', 'following']) AS job_type
+                    WHERE NOT EXISTS (SELECT 1 FROM recent)
+                    RETURNING job_id
+                """, (username, datetime.now() - timedelta(days=7), username))
+                
+                scheduled_jobs = cursor.fetchall()
                 
-                self.db_conn.commit()
+                # Wake up listening schedulers once the jobs are committed
+                if scheduled_jobs:
+                    cursor.execute("NOTIFY job_enqueued")
+            
+            if scheduled_jobs:
                 logger.info(f"Scheduled scraping jobs for {username}")
             else:
                 logger.info(f"User {username} already has recent jobs, skipping")
@@ -86,26 +73,34 @@ class JobScheduler:
             return
         
         try:
-            cursor = self.db_conn.cursor()
-            
             # Get a batch of pending jobs
             remaining_quota = self.daily_quota - self.current_day_processed
             batch_size = min(remaining_quota, 10)  # Process max 10 jobs at a time
             
-            cursor.execute("""
-                SELECT job_id, target_username, job_type
-                FROM scrape_jobs
-                WHERE status = 'pending'
-                ORDER BY job_id
-                LIMIT %s
-            """, (batch_size,))
-            
-            jobs = cursor.fetchall()
+            # Claim the batch atomically so concurrent schedulers never pick up the same job;
+            # the claim commits as soon as the block exits, releasing the row locks
+            with db_cursor() as cursor:
+                cursor.execute("""
+                    UPDATE scrape_jobs
+                    SET status = 'in_progress', started_at = NOW()
+                    WHERE job_id IN (
+                        SELECT job_id FROM scrape_jobs
+                        WHERE status = 'pending'
+                        ORDER BY job_id
+                        FOR UPDATE SKIP LOCKED
+                        LIMIT %s
+                    )
+                    RETURNING job_id, target_username, job_type
+                """, (batch_size,))
+                
+                jobs = sorted(cursor.fetchall())
             
             if not jobs:
                 logger.info("No pending jobs found")
                 return
             
+            completed_jobs = []
+            failed_jobs = []
             for job_id, username, job_type in jobs:
                 try:
                     # Add a random delay between jobs
@@ -123,54 +118,99 @@ class JobScheduler:
                     
                     # If we've processed both followers and following, calculate mutuals
                     if job_type in ['followers', 'following']:
-                        cursor.execute("""
-                            SELECT COUNT(*) FROM scrape_jobs
-                            WHERE target_username = %s 
-                            AND job_type IN ('followers', 'following')
-                            AND status = 'completed'
-                        """, (username,))
-                        
-                        completed_count = cursor.fetchone()[0]
+                        with db_cursor() as cursor:
+                            prepare_statement(cursor, "count_completed_lists", """
+                                SELECT COUNT(DISTINCT job_type) FROM scrape_jobs
+                                WHERE target_username = $1 
+                                AND job_type IN ('followers', 'following')
+                                AND status = 'completed'
+                            """)
+                            cursor.execute("EXECUTE count_completed_lists(%s)", (username,))
+                            
+                            completed_count = cursor.fetchone()[0]
                         
                         if completed_count == 2:  # Both followers and following are done
                             self.scraper.calculate_mutual_followers(username)
                     
+                    completed_jobs.append(job_id)
                     self.current_day_processed += 1
                     
                 except Exception as e:
                     logger.error(f"Error processing job {job_id}: {str(e)}")
-                    
-                    # Update job status to failed
+                    failed_jobs.append((str(e), job_id))
+            
+            # Mark claimed jobs completed or failed in a single round trip each
+            with db_cursor() as cursor:
+                if completed_jobs:
                     cursor.execute("""
                         UPDATE scrape_jobs
-                        SET status = 'failed', error_message = %s
-                        WHERE job_id = %s
-                    """, (str(e), job_id))
-                    self.db_conn.commit()
+                        SET status = 'completed', completed_at = NOW()
+                        WHERE job_id = ANY(%s)
+                    """, (completed_jobs,))
+                if failed_jobs:
+                    prepare_statement(cursor, "fail_job", """
+                        UPDATE scrape_jobs
+                        SET status = 'failed', error_message = $1
+                        WHERE job_id = $2
+                    """)
+                    execute_batch(cursor, "EXECUTE fail_job(%s, %s)", failed_jobs)
             
             logger.info(f"Processed {len(jobs)} jobs. Daily total: {self.current_day_processed}/{self.daily_quota}")
             
         except Exception as e:
             logger.error(f"Error in job processing: {str(e)}")
+        finally:
+            # Profiles are only reused within one batch, so later batches see fresh data
+            self.scraper.clear_profile_cache()
     
     def run_scheduler(self):
-        """Run the scheduler with defined intervals"""
-        # Process jobs every 30 minutes
+        """Run the scheduler, processing jobs as soon as they are enqueued"""
+        # Process jobs every 30 minutes in case a notification was missed
         schedule.every(30).minutes.do(self.process_pending_jobs)
         
+        # Listen for enqueued jobs on a dedicated autocommit connection
+        self.listen_conn = get_db_connection()
+        self.listen_conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        with self.listen_conn.cursor() as cursor:
+            cursor.execute("LISTEN job_enqueued")
+        
+        # Jobs enqueued before the listener attached sent no notification we can see
+        self.process_pending_jobs()
+        
         # Run the scheduler loop
         while True:
+            # Sleep until a job is enqueued or the next scheduled run is due
+            timeout = schedule.idle_seconds()
+            timeout = 300 if timeout is None else min(max(timeout, 0), 300)
+            
+            if select.select([self.listen_conn], [], [], timeout)[0]:
+                self.listen_conn.poll()
+                # One batch covers every notification received so far
+                self.listen_conn.notifies.clear()
+                self.process_pending_jobs()
+            
             schedule.run_pending()
-            time.sleep(60)  # Check every minute
     
     def cleanup(self):
         """Clean up resources"""
         if self.scraper:
             self.scraper.cleanup()
-        if self.db_conn:
-            self.db_conn.close()
+        if self.listen_conn:
+            self.listen_conn.close()
+
+def run_worker(daily_quota=200, log_file="instagram_pipeline.log"):
+    """Run one scheduler as a worker process, with its own scraper, connections and proxy budget"""
+    setup_logging(log_file)
+    scheduler = JobScheduler(daily_quota=daily_quota)
+    try:
+        scheduler.run_scheduler()
+    except KeyboardInterrupt:
+        logger.info("Scheduler worker stopped")
+    finally:
+        scheduler.cleanup()
 
 if __name__ == "__main__":
+    setup_logging("scheduler.log")
     scheduler = JobScheduler()
     try:
         # Add some initial users to scrape
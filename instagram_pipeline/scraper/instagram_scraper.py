@@ -1,98 +1,176 @@
 import time
+import asyncio
 import random
 import requests
 import json
 import os
+import atexit
+import threading
 import datetime
+from concurrent.futures import Future
 from dotenv import load_dotenv
-from fake_useragent import UserAgent
 import logging
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-import instaloader
+import aiohttp
+import redis
+
+from instagram_pipeline.scraper.async_client import AsyncInstagramClient
+from instagram_pipeline.scraper.proxy_manager import ProxyManager
+from instagram_pipeline.config import db_connection, db_cursor, get_redis_client
+from instagram_pipeline.database.helpers import copy_upsert, prepare_statement
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("instagram_scraper.log"),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger("InstagramScraper")
 
-class ProxyManager:
-    def __init__(self):
-        self.proxies = []
-        self.current_index = 0
-        # In a real implementation, you would load proxies from a service or file
-        # For this example, we'll just simulate it
-        self._load_proxies()
-    
-    def _load_proxies(self):
-        # In a real implementation, you would:
-        # 1. Connect to a proxy service API
-        # 2. Load a list of residential proxies
-        # Here we'll just use placeholders
-        self.proxies = [
-            {"http": "http://proxy1:port", "https": "https://proxy1:port"},
-            {"http": "http://proxy2:port", "https": "https://proxy2:port"},
-            # Add more proxies here
-        ]
-        random.shuffle(self.proxies)
+# Realistic desktop and mobile browser user agents to rotate through
+UA_POOL = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/118.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36 Edg/120.0.0.0",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:121.0) Gecko/20100101 Firefox/121.0",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:120.0) Gecko/20100101 Firefox/120.0",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.1 Safari/605.1.15",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.6 Safari/605.1.15",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:121.0) Gecko/20100101 Firefox/121.0",
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:121.0) Gecko/20100101 Firefox/121.0",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.1 Mobile/15E148 Safari/604.1",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 16_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.6 Mobile/15E148 Safari/604.1",
+    "Mozilla/5.0 (iPad; CPU OS 17_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.1 Mobile/15E148 Safari/604.1",
+    "Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Mobile Safari/537.36",
+    "Mozilla/5.0 (Linux; Android 13; SM-S918B) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Mobile Safari/537.36",
+    "Mozilla/5.0 (Linux; Android 13; SM-G991B) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Mobile Safari/537.36",
+)
+
+# One ChromeDriver process shared by every scraper in this process
+_driver_service = None
+_driver_service_lock = threading.Lock()
+
+def get_driver_service():
+    """Start the shared ChromeDriver service on first use and return it"""
+    global _driver_service
+    from selenium.webdriver.chrome.service import Service
     
-    def get_proxy(self):
-        if not self.proxies:
-            return None
-        
-        proxy = self.proxies[self.current_index]
-        self.current_index = (self.current_index + 1) % len(self.proxies)
-        return proxy
+    with _driver_service_lock:
+        if _driver_service is None or not _driver_service.is_connectable():
+            _driver_service = Service(executable_path=os.getenv('CHROMEDRIVER_PATH', 'chromedriver'))
+            _driver_service.start()
+            atexit.register(_driver_service.stop)
+        return _driver_service
 
 class InstagramScraper:
-    def __init__(self, db_connection, use_proxies=True):
+    # Relationship table and column for each edge job type
+    EDGE_TABLES = {
+        "followers": ("followers", "follower_id"),
+        "following": ("following", "following_id"),
+    }
+    write_batch_size = 500  # Accounts buffered per batched INSERT
+    copy_batch_size = 5000  # Accounts buffered per COPY when scraping a large list
+    copy_min_count = 5000  # Scrapes capped below this many accounts stay on batched INSERTs
+    USER_COLUMNS = ("user_id", "username", "full_name", "profile_pic_url", "is_private")
+    
+    # Redis cache lifetimes in seconds, by how quickly the cached data goes stale
+    CACHE_TTL_SHORT = 30
+    CACHE_TTL_NORMAL = 300
+    CACHE_TTL_LONG = 1800
+    
+    # How long an interrupted scrape can be resumed from its saved cursor
+    PROGRESS_TTL = 86400
+    
+    def __init__(self, db_pool=None, use_proxies=True):
         load_dotenv()
         self.username = os.getenv('INSTAGRAM_USERNAME')
         self.password = os.getenv('INSTAGRAM_PASSWORD')
-        self.db_conn = db_connection
-        self.user_agent = UserAgent()
+        self.db_pool = db_pool  # None uses the shared pool from config
         self.session = requests.Session()
         self.proxy_manager = ProxyManager() if use_proxies else None
-        self.last_request_time = time.time() - 10  # Initialize with offset
-        self.insta_loader = None
+        self.cookie_jar_path = ".ig_session.json"  # Session cookies saved after a Selenium login
+        self.session_cookies = None
+        self._session_lock = threading.Lock()  # Only one thread may log in when no session is saved
+        self.current_proxy = None
+        self._profiles = {}  # Profile lookups of the current run, shared by concurrent callers
+        self._profiles_lock = threading.Lock()
         self.selenium_driver = None
+        self.cache = get_redis_client()  # None disables caching
     
-    def _initialize_instaloader(self):
-        if self.insta_loader is None:
-            self.insta_loader = instaloader.Instaloader(
-                download_pictures=False,
-                download_videos=False,
-                download_video_thumbnails=False,
-                compress_json=False,
-                download_geotags=False,
-                post_metadata_txt_pattern='',
-                max_connection_attempts=3
-            )
+    def _load_session(self):
+        """Load saved session cookies, logging in with Selenium only when none are saved"""
+        with self._session_lock:
+            if self.session_cookies is not None:
+                return self.session_cookies
             
-            # Log in to Instagram
-            try:
-                self.insta_loader.login(self.username, self.password)
-                logger.info("Successfully logged in with Instaloader")
-            except Exception as e:
-                logger.error(f"Failed to login with Instaloader: {str(e)}")
+            if not os.path.exists(self.cookie_jar_path):
+                self._initialize_selenium()
+                self._export_cookies_to_jar()
+                # The cookies are all we need from the browser
+                self.selenium_driver.quit()
+                self.selenium_driver = None
+            
+            with open(self.cookie_jar_path) as f:
+                self.session_cookies = {cookie["name"]: cookie["value"] for cookie in json.load(f)}
+            return self.session_cookies
+    
+    def _export_cookies_to_jar(self):
+        """Save the logged-in browser's cookies for later sessions"""
+        with open(self.cookie_jar_path, "w") as f:
+            json.dump(self.selenium_driver.get_cookies(), f)
+        logger.info(f"Saved Instagram session cookies to {self.cookie_jar_path}")
+    
+    def _discard_session(self):
+        """Forget saved cookies that Instagram no longer accepts"""
+        self.session_cookies = None
+        if os.path.exists(self.cookie_jar_path):
+            os.remove(self.cookie_jar_path)
+    
+    def _new_client(self):
+        """Create an async API client authenticated with the saved session"""
+        proxy = self.proxy_manager.get_proxy() if self.proxy_manager else None
+        self.current_proxy = proxy
+        return AsyncInstagramClient(
+            cookies=self._load_session(),
+            headers=self._rotate_headers(),
+            proxy=proxy["http"] if proxy else None
+        )
+    
+    def _api_get(self, url, params=None):
+        """GET an Instagram API endpoint with the saved session, logging in again once if it expired"""
+        async def fetch():
+            async with self._new_client() as client:
+                return await client.api_get(url, params)
+        
+        try:
+            return asyncio.run(fetch())
+        except aiohttp.ClientProxyConnectionError:
+            # Count the failure against the proxy so repeatedly failing ones leave the rotation
+            if self.proxy_manager and self.current_proxy:
+                self.proxy_manager.mark_proxy_failed(self.current_proxy)
+            raise
+        except aiohttp.ClientResponseError as e:
+            if e.status not in (401, 403):
                 raise
+            logger.warning("Instagram session rejected, logging in again")
+            self._discard_session()
+            return asyncio.run(fetch())
     
     def _initialize_selenium(self):
+        # Selenium is only needed to log in, so it is not loaded until then
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+        from selenium.webdriver.chrome.remote_connection import ChromeRemoteConnection
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
+        
         if self.selenium_driver is None:
             options = Options()
             options.add_argument("--headless")
             options.add_argument("--no-sandbox")
             options.add_argument("--disable-dev-shm-usage")
-            options.add_argument(f"user-agent={self.user_agent.random}")
+            options.add_argument("--window-size=1366,768")
+            options.add_argument("--lang=en-US")
+            options.add_argument(f"user-agent={random.choice(UA_POOL)}")
             
             # Add proxy if using
             if self.proxy_manager:
@@ -101,7 +179,12 @@ class InstagramScraper:
                     proxy_str = proxy['https'].replace('https://', '')
                     options.add_argument(f'--proxy-server={proxy_str}')
             
-            self.selenium_driver = webdriver.Chrome(options=options)
+            # Open a session on the shared driver instead of launching a new driver process
+            service = get_driver_service()
+            self.selenium_driver = webdriver.Remote(
+                command_executor=ChromeRemoteConnection(remote_server_addr=service.service_url),
+                options=options
+            )
             
             # Login to Instagram
             try:
@@ -114,11 +197,11 @@ class InstagramScraper:
                 )
                 username_input.send_keys(self.username)
                 
-                # Enter password with human-like typing speed
+                # Enter password in one go; the login form doesn't check typing speed
                 password_input = self.selenium_driver.find_element(By.NAME, "password")
-                for char in self.password:
-                    password_input.send_keys(char)
-                    time.sleep(0.05 + random.random() * 0.1)
+                password_input.clear()
+                password_input.send_keys(self.password)
+                time.sleep(0.2 + random.random() * 0.4)
                 
                 # Click login button
                 login_button = self.selenium_driver.find_element(By.XPATH, "//button[@type='submit']")
@@ -139,7 +222,7 @@ class InstagramScraper:
                     not_now_button.click()
                 except:
                     pass  # Dialog may not appear, so we can ignore this
-                
+            
             except Exception as e:
                 logger.error(f"Failed to login with Selenium: {str(e)}")
                 if self.selenium_driver:
@@ -147,22 +230,10 @@ class InstagramScraper:
                     self.selenium_driver = None
                 raise
     
-    def _add_delay(self):
-        """Add random delay to avoid detection"""
-        elapsed = time.time() - self.last_request_time
-        min_delay = 3  # Minimum delay in seconds
-        
-        if elapsed < min_delay:
-            delay = min_delay - elapsed + (random.random() * 5)  # Add 0-5 random seconds
-            logger.debug(f"Adding delay of {delay:.2f} seconds")
-            time.sleep(delay)
-        
-        self.last_request_time = time.time()
-    
     def _rotate_headers(self):
         """Create new headers with a different user agent"""
         return {
-            'User-Agent': self.user_agent.random,
+            'User-Agent': random.choice(UA_POOL),
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
             'Accept-Language': 'en-US,en;q=0.5',
             'Connection': 'keep-alive',
@@ -170,275 +241,331 @@ class InstagramScraper:
             'Cache-Control': 'max-age=0',
         }
     
+    def _cache_get(self, key):
+        """Read a JSON value from Redis, treating cache errors as misses"""
+        if self.cache is None:
+            return None
+        try:
+            cached = self.cache.get(key)
+        except redis.RedisError as e:
+            logger.warning(f"Redis read failed for {key}: {str(e)}")
+            return None
+        return json.loads(cached) if cached else None
+    
+    def _cache_set(self, key, value, ttl):
+        """Store a JSON value in Redis for ttl seconds, ignoring cache errors"""
+        if self.cache is None:
+            return
+        try:
+            self.cache.setex(key, ttl, json.dumps(value, default=str))
+        except redis.RedisError as e:
+            logger.warning(f"Redis write failed for {key}: {str(e)}")
+    
+    def _load_progress(self, key):
+        """Read the saved cursor and count of an interrupted scrape, or None"""
+        if self.cache is None:
+            return None
+        try:
+            state = self.cache.hgetall(key)
+        except redis.RedisError as e:
+            logger.warning(f"Redis read failed for {key}: {str(e)}")
+            return None
+        return state if state.get("cursor") else None
+    
+    def _save_progress(self, key, cursor, count):
+        """Remember how far a scrape got so a rerun can continue from cursor"""
+        if self.cache is None:
+            return
+        try:
+            pipe = self.cache.pipeline()
+            pipe.hset(key, mapping={"cursor": cursor, "count": count})
+            pipe.expire(key, self.PROGRESS_TTL)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Redis write failed for {key}: {str(e)}")
+    
+    def _clear_progress(self, key):
+        """Drop the saved progress of a finished scrape"""
+        if self.cache is None:
+            return
+        try:
+            self.cache.delete(key)
+        except redis.RedisError as e:
+            logger.warning(f"Redis delete failed for {key}: {str(e)}")
+    
     def get_user_profile(self, username):
-        """Get user profile information"""
-        self._initialize_instaloader()
-        self._add_delay()
+        """Get user profile information, fetching each profile at most once per run"""
+        with self._profiles_lock:
+            profile = self._profiles.get(username)
+            owner = profile is None
+            if owner:
+                profile = self._profiles[username] = Future()
+        
+        # Callers that arrive while the first lookup is running wait for its result
+        if not owner:
+            return profile.result()
         
         try:
-            profile = instaloader.Profile.from_username(self.insta_loader.context, username)
-            
-            user_data = {
-                "user_id": profile.userid,
-                "username": profile.username,
-                "full_name": profile.full_name,
-                "bio": profile.biography,
-                "profile_pic_url": profile.profile_pic_url,
-                "follower_count": profile.followers,
-                "following_count": profile.followees,
-                "is_private": profile.is_private
-            }
-            
-            # Save to database
-            cursor = self.db_conn.cursor()
-            cursor.execute("""
-                INSERT INTO users 
-                (user_id, username, full_name, bio, profile_pic_url, follower_count, following_count, is_private)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (user_id) 
-                DO UPDATE SET 
-                    username = EXCLUDED.username,
-                    full_name = EXCLUDED.full_name,
-                    bio = EXCLUDED.bio,
-                    profile_pic_url = EXCLUDED.profile_pic_url,
-                    follower_count = EXCLUDED.follower_count,
-                    following_count = EXCLUDED.following_count,
-                    is_private = EXCLUDED.is_private,
-                    last_updated = CURRENT_TIMESTAMP
-            """, (
-                user_data["user_id"],
-                user_data["username"],
-                user_data["full_name"],
-                user_data["bio"],
-                user_data["profile_pic_url"],
-                user_data["follower_count"],
-                user_data["following_count"],
-                user_data["is_private"]
-            ))
-            self.db_conn.commit()
-            
-            logger.info(f"Successfully retrieved and stored profile for {username}")
-            return user_data
-            
+            profile.set_result(self._fetch_user_profile(username))
         except Exception as e:
-            logger.error(f"Error getting profile for {username}: {str(e)}")
-            raise
+            # Let the next caller retry instead of replaying the failure
+            with self._profiles_lock:
+                del self._profiles[username]
+            profile.set_exception(e)
+        return profile.result()
     
-    def get_followers(self, username, max_count=None):
-        """Get a user's followers with pagination and rate limiting"""
-        self._initialize_instaloader()
+    def clear_profile_cache(self):
+        """Forget the profiles looked up during this run"""
+        with self._profiles_lock:
+            self._profiles.clear()
+    
+    def _fetch_user_profile(self, username):
+        """Look up a profile in Redis or on Instagram and store it"""
+        # Profiles change slowly, so a recent copy skips the Instagram request.
+        # The key is per database so test databases never reuse production profiles.
+        cache_key = f"profile:{os.getenv('DB_NAME')}:{username}"
         
         try:
-            # Create scrape job entry
-            cursor = self.db_conn.cursor()
-            cursor.execute("""
-                INSERT INTO scrape_jobs (target_username, job_type, status, started_at)
-                VALUES (%s, %s, %s, %s)
-                RETURNING job_id
-            """, (username, 'followers', 'in_progress', datetime.datetime.now()))
-            job_id = cursor.fetchone()[0]
-            self.db_conn.commit()
-            
-            # Get profile
-            profile = instaloader.Profile.from_username(self.insta_loader.context, username)
-            user_id = profile.userid
-            
-            # Get followers
-            follower_count = 0
-            for follower in profile.get_followers():
-                self._add_delay()  # Add delay between requests
+            user_data = self._cache_get(cache_key)
+            if user_data:
+                logger.info(f"Using cached profile for {username}")
+            else:
+                data = self._api_get(AsyncInstagramClient.PROFILE_URL, {"username": username})
+                user = data["data"]["user"]
                 
-                # First ensure follower exists in users table
-                follower_data = {
-                    "user_id": follower.userid,
-                    "username": follower.username,
-                    "full_name": follower.full_name,
-                    "profile_pic_url": follower.profile_pic_url,
-                    "is_private": follower.is_private
+                user_data = {
+                    "user_id": user["id"],
+                    "username": user["username"],
+                    "full_name": user.get("full_name"),
+                    "bio": user.get("biography"),
+                    "profile_pic_url": user.get("profile_pic_url"),
+                    "follower_count": user["edge_followed_by"]["count"],
+                    "following_count": user["edge_follow"]["count"],
+                    "is_private": user.get("is_private")
                 }
-                
+                self._cache_set(cache_key, user_data, self.CACHE_TTL_LONG)
+            
+            # Save to database, even for cached profiles, so edges always have their users row
+            with db_cursor(self.db_pool) as cursor:
                 cursor.execute("""
                     INSERT INTO users 
-                    (user_id, username, full_name, profile_pic_url, is_private)
-                    VALUES (%s, %s, %s, %s, %s)
-                    ON CONFLICT (user_id) DO NOTHING
+                    (user_id, username, full_name, bio, profile_pic_url, follower_count, following_count, is_private)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (user_id) 
+                    DO UPDATE SET 
+                        username = EXCLUDED.username,
+                        full_name = EXCLUDED.full_name,
+                        bio = EXCLUDED.bio,
+                        profile_pic_url = EXCLUDED.profile_pic_url,
+                        follower_count = EXCLUDED.follower_count,
+                        following_count = EXCLUDED.following_count,
+                        is_private = EXCLUDED.is_private,
+                        last_updated = CURRENT_TIMESTAMP
                 """, (
-                    follower_data["user_id"],
-                    follower_data["username"],
-                    follower_data["full_name"],
-                    follower_data["profile_pic_url"],
-                    follower_data["is_private"]
+                    user_data["user_id"],
+                    user_data["username"],
+                    user_data["full_name"],
+                    user_data["bio"],
+                    user_data["profile_pic_url"],
+                    user_data["follower_count"],
+                    user_data["following_count"],
+                    user_data["is_private"]
                 ))
-                
-                # Then add follower relationship
-                cursor.execute("""
-                    INSERT INTO followers (user_id, follower_id)
-                    VALUES (%s, %s)
-                    ON CONFLICT (user_id, follower_id) DO NOTHING
-                """, (user_id, follower.userid))
-                
-                follower_count += 1
-                
-                if follower_count % 10 == 0:
-                    # Update progress and commit every 10 followers
-                    cursor.execute("""
-                        UPDATE scrape_jobs
-                        SET processed_items = %s
-                        WHERE job_id = %s
-                    """, (follower_count, job_id))
-                    self.db_conn.commit()
-                
-                if max_count and follower_count >= max_count:
-                    break
-            
-            # Mark job as complete
-            cursor.execute("""
-                UPDATE scrape_jobs
-                SET status = 'completed', 
-                    completed_at = %s,
-                    total_items = %s,
-                    processed_items = %s
-                WHERE job_id = %s
-            """, (datetime.datetime.now(), follower_count, follower_count, job_id))
-            self.db_conn.commit()
-            
-            logger.info(f"Successfully retrieved {follower_count} followers for {username}")
             
+            logger.info(f"Successfully retrieved and stored profile for {username}")
+            return user_data
+        
         except Exception as e:
-            # Update job with error
-            cursor.execute("""
-                UPDATE scrape_jobs
-                SET status = 'failed', 
-                    error_message = %s
-                WHERE job_id = %s
-            """, (str(e), job_id))
-            self.db_conn.commit()
-            
-            logger.error(f"Error getting followers for {username}: {str(e)}")
+            logger.error(f"Error getting profile for {username}: {str(e)}")
             raise
     
+    def get_followers(self, username, max_count=None):
+        """Get a user's followers with pagination and rate limiting"""
+        return self._scrape_edges(username, "followers", max_count)
+    
     def get_following(self, username, max_count=None):
         """Get accounts that a user follows with pagination and rate limiting"""
-        self._initialize_instaloader()
-        
+        return self._scrape_edges(username, "following", max_count)
+    
+    def _scrape_edges(self, username, job_type, max_count=None):
+        """Scrape a user's followers or following into the database, tracked by a scrape job"""
         try:
             # Create scrape job entry
-            cursor = self.db_conn.cursor()
-            cursor.execute("""
-                INSERT INTO scrape_jobs (target_username, job_type, status, started_at)
-                VALUES (%s, %s, %s, %s)
-                RETURNING job_id
-            """, (username, 'following', 'in_progress', datetime.datetime.now()))
-            job_id = cursor.fetchone()[0]
-            self.db_conn.commit()
+            with db_cursor(self.db_pool) as cursor:
+                cursor.execute("""
+                    INSERT INTO scrape_jobs (target_username, job_type, status, started_at)
+                    VALUES (%s, %s, %s, %s)
+                    RETURNING job_id
+                """, (username, job_type, 'in_progress', datetime.datetime.now()))
+                job_id = cursor.fetchone()[0]
             
             # Get profile
-            profile = instaloader.Profile.from_username(self.insta_loader.context, username)
-            user_id = profile.userid
+            user_id = self.get_user_profile(username)["user_id"]
             
-            # Get following
-            following_count = 0
-            for following in profile.get_followees():
-                self._add_delay()  # Add delay between requests
-                
-                # First ensure following exists in users table
-                following_data = {
-                    "user_id": following.userid,
-                    "username": following.username,
-                    "full_name": following.full_name,
-                    "profile_pic_url": following.profile_pic_url,
-                    "is_private": following.is_private
-                }
-                
-                cursor.execute("""
-                    INSERT INTO users 
-                    (user_id, username, full_name, profile_pic_url, is_private)
-                    VALUES (%s, %s, %s, %s, %s)
-                    ON CONFLICT (user_id) DO NOTHING
-                """, (
-                    following_data["user_id"],
-                    following_data["username"],
-                    following_data["full_name"],
-                    following_data["profile_pic_url"],
-                    following_data["is_private"]
-                ))
-                
-                # Then add following relationship
-                cursor.execute("""
-                    INSERT INTO following (user_id, following_id)
-                    VALUES (%s, %s)
-                    ON CONFLICT (user_id, following_id) DO NOTHING
-                """, (user_id, following.userid))
-                
-                following_count += 1
+            # Only uncapped scrapes save or resume progress, so a capped run never picks up or
+            # clears another run's cursor; the key is per database like the profile cache
+            progress_key = f"progress:{os.getenv('DB_NAME')}:{username}:{job_type}" if max_count is None else None
+            
+            # Page through the list concurrently with storing it on a connection of our own
+            with db_connection(self.db_pool) as conn:
+                count = asyncio.run(self._collect_edges(conn, job_id, user_id, job_type, max_count, progress_key))
                 
-                if following_count % 10 == 0:
-                    # Update progress and commit every 10 following
+                # Mark job as complete
+                with conn.cursor() as cursor:
                     cursor.execute("""
                         UPDATE scrape_jobs
-                        SET processed_items = %s
+                        SET status = 'completed', 
+                            completed_at = %s,
+                            total_items = %s,
+                            processed_items = %s
                         WHERE job_id = %s
-                    """, (following_count, job_id))
-                    self.db_conn.commit()
-                
-                if max_count and following_count >= max_count:
-                    break
-            
-            # Mark job as complete
-            cursor.execute("""
-                UPDATE scrape_jobs
-                SET status = 'completed', 
-                    completed_at = %s,
-                    total_items = %s,
-                    processed_items = %s
-                WHERE job_id = %s
-            """, (datetime.datetime.now(), following_count, following_count, job_id))
-            self.db_conn.commit()
-            
-            logger.info(f"Successfully retrieved {following_count} following for {username}")
+                    """, (datetime.datetime.now(), count, count, job_id))
+            if progress_key:
+                self._clear_progress(progress_key)
             
+            logger.info(f"Successfully retrieved {count} {job_type} for {username}")
+        
         except Exception as e:
             # Update job with error
-            cursor.execute("""
-                UPDATE scrape_jobs
-                SET status = 'failed', 
-                    error_message = %s
-                WHERE job_id = %s
-            """, (str(e), job_id))
-            self.db_conn.commit()
+            with db_cursor(self.db_pool) as cursor:
+                cursor.execute("""
+                    UPDATE scrape_jobs
+                    SET status = 'failed', 
+                        error_message = %s
+                    WHERE job_id = %s
+                """, (str(e), job_id))
             
-            logger.error(f"Error getting following for {username}: {str(e)}")
+            logger.error(f"Error getting {job_type} for {username}: {str(e)}")
             raise
     
+    async def _collect_edges(self, conn, job_id, user_id, job_type, max_count=None, progress_key=None):
+        """Store each page of followers or following as the async client fetches them"""
+        table, column = self.EDGE_TABLES[job_type]
+        client = self._new_client()
+        
+        # Continue an interrupted scrape from the last page that reached the database
+        count = 0
+        end_cursor = None
+        state = self._load_progress(progress_key) if progress_key else None
+        if state:
+            end_cursor = state["cursor"]
+            count = int(state["count"])
+            logger.info(f"Resuming {job_type} scrape at {count} accounts")
+        
+        # Large or uncapped lists are loaded through COPY in bigger batches
+        bulk = max_count is None or max_count > self.copy_min_count
+        batch_size = self.copy_batch_size if bulk else self.write_batch_size
+        
+        users_buf = []
+        edges_buf = []
+        async with client:
+            pages = client.iter_edges(user_id, job_type, end_cursor)
+            try:
+                async for accounts, page_info in pages:
+                    if max_count:
+                        accounts = accounts[:max_count - count]
+                    
+                    for account in accounts:
+                        users_buf.append((
+                            account["user_id"],
+                            account["username"],
+                            account["full_name"],
+                            account["profile_pic_url"],
+                            account["is_private"]
+                        ))
+                        edges_buf.append((user_id, account["user_id"]))
+                    count += len(accounts)
+                    end_cursor = page_info.get("end_cursor")
+                    
+                    if len(users_buf) >= batch_size:
+                        self._flush_edges(conn, job_id, table, column, users_buf, edges_buf, count, end_cursor, bulk)
+                        # Only save the cursor once its pages are committed, so a resume never skips rows
+                        if progress_key and end_cursor:
+                            self._save_progress(progress_key, end_cursor, count)
+                    
+                    if max_count and count >= max_count:
+                        break
+            finally:
+                # Stop the prefetched page request when the list is cut short
+                await pages.aclose()
+        
+        if users_buf:
+            self._flush_edges(conn, job_id, table, column, users_buf, edges_buf, count, end_cursor, bulk)
+        
+        return count
+    
+    def _flush_edges(self, conn, job_id, table, column, users_buf, edges_buf, count, end_cursor=None, bulk=False):
+        """Write buffered accounts and relationships with one prepared INSERT or COPY each, then commit"""
+        with conn.cursor() as cursor:
+            if bulk:
+                # COPY parses far less per row than INSERT, which pays off on the larger batches
+                copy_upsert(cursor, "users", self.USER_COLUMNS, users_buf, "ON CONFLICT (user_id) DO NOTHING")
+                copy_upsert(cursor, table, ("user_id", column), edges_buf, f"ON CONFLICT (user_id, {column}) DO NOTHING")
+            else:
+                self._insert_edges(cursor, table, column, users_buf, edges_buf)
+            
+            # Update progress and commit once per batch
+            prepare_statement(cursor, "update_job_progress", """
+                UPDATE scrape_jobs
+                SET processed_items = $1, last_cursor = $2
+                WHERE job_id = $3
+            """)
+            cursor.execute("EXECUTE update_job_progress(%s, %s, %s)", (count, end_cursor, job_id))
+        conn.commit()
+        
+        users_buf.clear()
+        edges_buf.clear()
+    
+    def _insert_edges(self, cursor, table, column, users_buf, edges_buf):
+        """Insert buffered accounts and relationships with one prepared INSERT each"""
+        # The statements take whole columns as arrays, so one prepared plan serves any batch size
+        prepare_statement(cursor, "ins_users", """
+            INSERT INTO users 
+            (user_id, username, full_name, profile_pic_url, is_private)
+            SELECT * FROM unnest($1::varchar[], $2::varchar[], $3::varchar[], $4::text[], $5::boolean[])
+            ON CONFLICT (user_id) DO NOTHING
+        """)
+        prepare_statement(cursor, f"ins_{table}", f"""
+            INSERT INTO {table} (user_id, {column})
+            SELECT $1, unnest($2::varchar[])
+            ON CONFLICT (user_id, {column}) DO NOTHING
+        """)
+        
+        # First ensure the accounts exist in users table
+        cursor.execute("EXECUTE ins_users(%s, %s, %s, %s, %s)", [list(values) for values in zip(*users_buf)])
+        
+        # Then add the relationships
+        cursor.execute(f"EXECUTE ins_{table}(%s, %s)", (edges_buf[0][0], [edge[1] for edge in edges_buf]))
+    
     def calculate_mutual_followers(self, username):
         """Calculate and store mutual followers for a user"""
         try:
-            cursor = self.db_conn.cursor()
-            
-            # Get user ID
-            cursor.execute("SELECT user_id FROM users WHERE username = %s", (username,))
-            result = cursor.fetchone()
-            if not result:
-                logger.error(f"User {username} not found in database")
-                return
-            
-            user_id = result[0]
-            
-            # Calculate and store mutual followers
-            cursor.execute("""
-                INSERT INTO mutuals (user_id, mutual_id)
-                SELECT f1.user_id, f1.follower_id
-                FROM followers f1
-                JOIN following f2 ON f1.user_id = f2.user_id AND f1.follower_id = f2.following_id
-                WHERE f1.user_id = %s
-                ON CONFLICT (user_id, mutual_id) DO NOTHING
-            """, (user_id,))
-            
-            mutual_count = cursor.rowcount
-            self.db_conn.commit()
+            with db_cursor(self.db_pool) as cursor:
+                # Get user ID
+                cursor.execute("SELECT user_id FROM users WHERE username = %s", (username,))
+                result = cursor.fetchone()
+                if not result:
+                    logger.error(f"User {username} not found in database")
+                    return
+                
+                user_id = result[0]
+                
+                # Calculate and store mutual followers, skipping pairs already recorded
+                cursor.execute("""
+                    INSERT INTO mutuals (user_id, mutual_id)
+                    SELECT f1.user_id, f1.follower_id
+                    FROM followers f1
+                    JOIN following f2 ON f1.user_id = f2.user_id AND f1.follower_id = f2.following_id
+                    WHERE f1.user_id = %s
+                    EXCEPT
+                    SELECT user_id, mutual_id FROM mutuals WHERE user_id = %s
+                    ON CONFLICT (user_id, mutual_id) DO NOTHING
+                """, (user_id, user_id))
+                
+                mutual_count = cursor.rowcount
             
             logger.info(f"Calculated {mutual_count} mutual followers for {username}")
-            
+        
         except Exception as e:
             logger.error(f"Error calculating mutual followers for {username}: {str(e)}")
             raise
@@ -2,65 +2,74 @@ import random
 import logging
 import requests
 import os
-from instagram_pipeline.config import get_proxy_api_key
+from collections import deque
+from instagram_pipeline.config import get_proxy_api_key, get_proxy_urls
 
 logger = logging.getLogger(__name__)
 
 class ProxyManager:
     """Manages a pool of proxies for rotating IP addresses"""
     
+    max_failures = 3  # Failures before a proxy is dropped from the pool
+    random_pick_threshold = 50  # Above this pool size, pick at random so one slow proxy can't stall the rotation
+    
     def __init__(self):
-        self.proxies = []
-        self.current_index = 0
+        self.proxies = deque()
+        self.fail_counts = {}
+        self.configured = False  # Whether any proxies were loaded; without them requests go out directly
         self.api_key = get_proxy_api_key()
         self._load_proxies()
     
     def _load_proxies(self):
-        """Load proxies from a service or file"""
-        # In a real implementation, you would connect to a proxy service API
-        # This is a placeholder implementation
-        
+        """Load proxies from a service or the PROXY_URLS setting"""
         try:
+            proxies = []
             if self.api_key:
                 # Example of fetching from a proxy API service
                 # response = requests.get(f"https://proxy-provider.com/api/proxies?api_key={self.api_key}")
                 # if response.status_code == 200:
-                #     self.proxies = response.json()["proxies"]
+                #     proxies = response.json()["proxies"]
                 pass
             
-            # For demonstration purposes, we'll add some placeholder proxies
-            # In a real implementation, these would come from your proxy service
-            self.proxies = [
-                {"http": "http://proxy1:port", "https": "https://proxy1:port"},
-                {"http": "http://proxy2:port", "https": "https://proxy2:port"},
-                {"http": "http://proxy3:port", "https": "https://proxy3:port"},
-            ]
+            # Each proxy handles both schemes, as aiohttp and Chrome expect
+            proxies.extend({"http": url, "https": url} for url in get_proxy_urls())
             
-            random.shuffle(self.proxies)
-            logger.info(f"Loaded {len(self.proxies)} proxies")
+            random.shuffle(proxies)
+            self.proxies = deque(proxies)
+            self.fail_counts = {}
+            self.configured = bool(proxies)
+            if self.proxies:
+                logger.info(f"Loaded {len(self.proxies)} proxies")
+            else:
+                logger.info("No proxies configured, connecting directly")
             
         except Exception as e:
             logger.error(f"Error loading proxies: {str(e)}")
-            # Add some fallback proxies in case the service fails
-            self.proxies = []
+            self.proxies = deque()
     
     def get_proxy(self):
         """Get the next proxy from the rotation"""
         if not self.proxies:
-            logger.warning("No proxies available")
+            # Never fall back to a direct connection once proxies were configured
+            if self.configured:
+                raise RuntimeError("All configured proxies have failed, check PROXY_URLS")
             return None
         
-        proxy = self.proxies[self.current_index]
-        self.current_index = (self.current_index + 1) % len(self.proxies)
+        if len(self.proxies) > self.random_pick_threshold:
+            return random.choice(self.proxies)
+        
+        proxy = self.proxies[0]
+        self.proxies.rotate(-1)
         return proxy
     
     def mark_proxy_failed(self, proxy):
-        """Mark a proxy as failed and remove it from the pool"""
-        if proxy in self.proxies:
+        """Record a proxy failure, removing the proxy from the pool once it fails repeatedly"""
+        key = proxy["https"]
+        self.fail_counts[key] = self.fail_counts.get(key, 0) + 1
+        
+        if self.fail_counts[key] >= self.max_failures and proxy in self.proxies:
             self.proxies.remove(proxy)
+            del self.fail_counts[key]
             logger.info(f"Removed failed proxy. {len(self.proxies)} proxies remaining")
-            
-            # If proxies are running low, try to reload
-            if len(self.proxies) < 3:
-                logger.info("Proxy pool running low, attempting to reload")
-                self._load_proxies()
\ No newline at end of file
+            if not self.proxies:
+                logger.error("Every configured proxy has failed")
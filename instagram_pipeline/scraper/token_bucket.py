@@ -0,0 +1,55 @@
+import time
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger("TokenBucket")
+
+# Sustained request rate Instagram tolerates from one IP (about 200 per hour) and the burst allowed on top
+INSTAGRAM_RATE = 200 / 3600
+INSTAGRAM_BURST = 10
+
+
+class TokenBucket:
+    """Token bucket that lets concurrent requests share one sustained request rate"""
+
+    def __init__(self, rate=INSTAGRAM_RATE, burst=INSTAGRAM_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()  # Buckets are shared by scrapers running in other threads
+
+    def _take(self):
+        """Refill for the time elapsed and take a token, returning how long to wait if none is left"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        """Wait until a token is available and consume it"""
+        while True:
+            wait = self._take()
+            if not wait:
+                return
+            logger.debug(f"Request budget spent, waiting {wait:.2f} seconds")
+            await asyncio.sleep(wait)
+
+
+# One bucket per outgoing IP, shared by every client that uses it
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(key):
+    """Return the shared bucket for a proxy URL, or for direct requests when key is None"""
+    with _buckets_lock:
+        if key not in _buckets:
+            _buckets[key] = TokenBucket()
+        return _buckets[key]
\ No newline at end of file
@@ -1,26 +1,19 @@
-import os
+import asyncio
 import logging
-import time
 import argparse
-import psycopg2
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 # Import our modules
 from instagram_pipeline.database.setup import create_database, create_tables
 from instagram_pipeline.scraper.instagram_scraper import InstagramScraper
-from instagram_pipeline.scheduler.job_scheduler import JobScheduler
+from instagram_pipeline.scheduler.job_scheduler import JobScheduler, run_worker
 from instagram_pipeline.analysis.interest_analyzer import InterestAnalyzer
-r
+from instagram_pipeline.config import close_db_pool, setup_logging
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("instagram_pipeline.log"),
-        logging.StreamHandler()
-    ]
-)
+setup_logging("instagram_pipeline.log")
 logger = logging.getLogger("InstagramPipeline")
 
 class InstagramPipeline:
@@ -30,23 +23,11 @@ class InstagramPipeline:
         create_database()
         create_tables()
         
-        # Get database connection
-        self.db_conn = self._get_db_connection()
-        
-        # Initialize components
-        self.scraper = InstagramScraper(self.db_conn)
+        # Initialize components; they share the connection pool from config
+        self.scraper = InstagramScraper()
         self.scheduler = JobScheduler()
         self.analyzer = InterestAnalyzer()
     
-    def _get_db_connection(self):
-        return psycopg2.connect(
-            host=os.getenv('DB_HOST'),
-            port=os.getenv('DB_PORT'),
-            dbname=os.getenv('DB_NAME'),
-            user=os.getenv('DB_USER'),
-            password=os.getenv('DB_PASSWORD')
-        )
-    
     def add_target_user(self, username):
         """Add a target user to scrape"""
         logger.info(f"Adding target user: {username}")
@@ -57,19 +38,19 @@ class InstagramPipeline:
         logger.info(f"Running manual scrape for user: {username}")
         
         try:
-            # 1. Get user profile
-            self.scraper.get_user_profile(username)
-            logger.info(f"Profile for {username} scraped successfully")
-            
-            # 2. Get followers
-            self.scraper.get_followers(username)
-            logger.info(f"Followers for {username} scraped successfully")
-            
-            # 3. Get following
-            self.scraper.get_following(username)
-            logger.info(f"Following for {username} scraped successfully")
+            # 1-3. Profile, followers and following use separate endpoints and tables, so run them together
+            steps = {
+                "Profile": self.scraper.get_user_profile,
+                "Followers": self.scraper.get_followers,
+                "Following": self.scraper.get_following,
+            }
+            with ThreadPoolExecutor(max_workers=len(steps)) as executor:
+                futures = {name: executor.submit(step, username) for name, step in steps.items()}
+                for name, future in futures.items():
+                    future.result()
+                    logger.info(f"{name} for {username} scraped successfully")
             
-            # 4. Calculate mutual followers
+            # 4. Calculate mutual followers once both lists are stored
             self.scraper.calculate_mutual_followers(username)
             logger.info(f"Mutual followers for {username} calculated successfully")
             
@@ -81,10 +62,12 @@ class InstagramPipeline:
         except Exception as e:
             logger.error(f"Error during manual scrape for {username}: {str(e)}")
             return False
+        finally:
+            self.scraper.clear_profile_cache()
     
-    def run_scheduled_pipeline(self):
+    def run_scheduled_pipeline(self, workers=1):
         """Run the scheduled pipeline continuously"""
-        logger.info("Starting scheduled pipeline")
+        logger.info(f"Starting scheduled pipeline with {workers} worker(s)")
         
         try:
             # Add your initial target users here
@@ -92,9 +75,21 @@ class InstagramPipeline:
             for username in initial_users:
                 self.add_target_user(username)
             
-            # Start the scheduler's job loop
-            self.scheduler.run_scheduler()
+            if workers == 1:
+                # Start the scheduler's job loop
+                self.scheduler.run_scheduler()
+                return
             
+            # Each worker claims jobs from the shared queue with SKIP LOCKED, so they never collide;
+            # spawned processes start with fresh connection pools instead of inheriting ours
+            context = multiprocessing.get_context("spawn")
+            quota = max(self.scheduler.daily_quota // workers, 1)
+            processes = [context.Process(target=run_worker, args=(quota,)) for _ in range(workers)]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+        
         except KeyboardInterrupt:
             logger.info("Pipeline stopped by user")
         except Exception as e:
@@ -105,16 +100,20 @@ class InstagramPipeline:
         logger.info("Starting interest analysis for pending users")
         
         try:
-            while True:
-                self.analyzer.process_pending_users()
-                logger.info("Waiting for next batch of users...")
-                time.sleep(300)  # Check every 5 minutes
-                
+            asyncio.run(self._analyze_pending_users_forever())
+        
         except KeyboardInterrupt:
             logger.info("Interest analysis stopped by user")
         except Exception as e:
             logger.error(f"Error in interest analysis: {str(e)}")
     
+    async def _analyze_pending_users_forever(self):
+        """Analyze pending users on one event loop, so the analyzer's GPT-4 limits persist between batches"""
+        while True:
+            await self.analyzer.process_pending_users_async()
+            logger.info("Waiting for next batch of users...")
+            await asyncio.sleep(300)  # Check every 5 minutes
+    
     def cleanup(self):
         """Clean up all resources"""
         if self.scraper:
@@ -123,14 +122,15 @@ class InstagramPipeline:
             self.scheduler.cleanup()
         if self.analyzer:
             self.analyzer.cleanup()
-        if self.db_conn:
-            self.db_conn.close()
+        close_db_pool()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Instagram Data Pipeline")
     parser.add_argument("--mode", choices=["scheduled", "manual", "analysis"], default="scheduled",
                         help="Pipeline mode: scheduled, manual, or analysis only")
     parser.add_argument("--username", help="Username for manual mode")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Scheduler worker processes for scheduled mode")
     
     args = parser.parse_args()
     
@@ -138,7 +138,7 @@ if __name__ == "__main__":
     
     try:
         if args.mode == "scheduled":
-            pipeline.run_scheduled_pipeline()
+            pipeline.run_scheduled_pipeline(args.workers)
         elif args.mode == "manual":
             if not args.username:
                 print("Error: Username required for manual mode")
@@ -0,0 +1,55 @@
+import os
+import pytest
+from unittest.mock import MagicMock, AsyncMock
+from dotenv import load_dotenv
+
+from instagram_pipeline.config import close_db_pool, get_db_pool
+from instagram_pipeline.database.setup import create_database, create_tables
+
+# Read .env once when the test session starts
+load_dotenv()
+
+
+def setup_test_database():
+    """Point the pipeline at the test database and create its schema; later calls in the run are no-ops"""
+    # Each pytest-xdist worker gets a database of its own so parallel tests never share rows
+    worker = os.environ.get('PYTEST_XDIST_WORKER')
+    os.environ['DB_NAME'] = f'instagram_test_{worker}' if worker else 'instagram_test_db'
+    create_database()
+    create_tables()
+
+
+@pytest.fixture(scope="session")
+def db_conn():
+    """Connection to the test database shared by every test in the session"""
+    setup_test_database()
+    
+    # Borrow from the pipeline's own pool, so tests and the code under test share its connections
+    pool = get_db_pool()
+    conn = pool.getconn()
+    yield conn
+    pool.putconn(conn)
+    close_db_pool()
+
+
+@pytest.fixture(scope="class", autouse=True)
+def bind_db_conn(request):
+    """Expose the shared connection as cls.db_conn on test classes that declare one"""
+    if request.cls is not None and hasattr(request.cls, "db_conn"):
+        request.cls.db_conn = request.getfixturevalue("db_conn")
+
+
+@pytest.fixture(scope="module")
+def gpt_mock(request):
+    """OpenAI client mock answering every chat completion with the test module's SAMPLE_GPT_CONTENT"""
+    content = getattr(request.module, "SAMPLE_GPT_CONTENT", '{"results": []}')
+    
+    # Wired once per module; tests only reset the recorded calls
+    response = MagicMock()
+    response.choices = [MagicMock(message=MagicMock(content=content))]
+    raw_response = MagicMock(headers={})
+    raw_response.parse.return_value = response
+    
+    client = MagicMock()
+    client.chat.completions.with_raw_response.create = AsyncMock(return_value=raw_response)
+    return client
\ No newline at end of file
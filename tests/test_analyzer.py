@@ -0,0 +1,97 @@
+import unittest
+import asyncio
+import gzip
+import time
+import tempfile
+from pathlib import Path
+
+from instagram_pipeline.analysis.rate_limiter import RateLimiter, parse_reset_duration
+from instagram_pipeline.analysis.interest_analyzer import InterestAnalyzer
+
+
+class TestRateLimiter(unittest.TestCase):
+    """Test cases for the OpenAI rate limiter"""
+
+    def test_parse_reset_duration(self):
+        """Test conversion of OpenAI reset headers to seconds"""
+        self.assertAlmostEqual(parse_reset_duration("1s"), 1.0)
+        self.assertAlmostEqual(parse_reset_duration("6m0s"), 360.0)
+        self.assertAlmostEqual(parse_reset_duration("20ms"), 0.02)
+        self.assertAlmostEqual(parse_reset_duration("1h2m3.5s"), 3723.5)
+        self.assertEqual(parse_reset_duration(None), 0.0)
+
+    def test_update_from_headers(self):
+        """Test that response headers replace the local quota estimate"""
+        limiter = RateLimiter()
+        limiter.update_from_headers({
+            "x-ratelimit-limit-requests": "200",
+            "x-ratelimit-limit-tokens": "40000",
+            "x-ratelimit-remaining-requests": "199",
+            "x-ratelimit-remaining-tokens": "38000",
+            "x-ratelimit-reset-requests": "300ms",
+            "x-ratelimit-reset-tokens": "3s",
+        })
+
+        self.assertEqual(limiter.request_limit, 200)
+        self.assertEqual(limiter.token_limit, 40000)
+        self.assertEqual(limiter.available_requests, 199)
+        self.assertEqual(limiter.available_tokens, 38000)
+        self.assertGreater(limiter.tokens_reset_at, time.monotonic())
+
+    def test_acquire_consumes_quota(self):
+        """Test that acquire returns immediately while quota is available"""
+        limiter = RateLimiter(requests_per_minute=10, tokens_per_minute=1000)
+        asyncio.run(limiter.acquire(estimated_tokens=100))
+
+        self.assertEqual(limiter.available_requests, 9)
+        self.assertEqual(limiter.available_tokens, 900)
+
+    def test_acquire_waits_for_reset(self):
+        """Test that acquire sleeps until the request window resets"""
+        limiter = RateLimiter()
+        limiter.update_from_headers({
+            "x-ratelimit-remaining-requests": "0",
+            "x-ratelimit-reset-requests": "100ms",
+        })
+
+        started = time.monotonic()
+        asyncio.run(limiter.acquire(estimated_tokens=10))
+
+        self.assertGreaterEqual(time.monotonic() - started, 0.05)
+
+
+class TestResponseCache(unittest.TestCase):
+    """Test cases for the gzipped JSON Lines GPT-4 response cache"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.cache_path = Path(tmp.name) / "cache" / "responses.jsonl.gz"
+
+    def make_analyzer(self):
+        """Build an analyzer with only the response cache set up; these tests need no database or API client"""
+        analyzer = InterestAnalyzer.__new__(InterestAnalyzer)
+        analyzer.response_cache_path = self.cache_path
+        analyzer._response_cache = analyzer._load_response_cache()
+        return analyzer
+
+    def test_round_trip(self):
+        """Test that saved responses are read back by a new analyzer"""
+        results = [{"username": "chef_anna", "category": "Food", "confidence": 0.9}]
+        writer = self.make_analyzer()
+        writer._save_response("a", results)
+        writer._save_response("b", [])
+
+        self.assertEqual(self.make_analyzer()._response_cache, {"a": results, "b": []})
+
+    def test_truncated_trailing_line(self):
+        """Test that a half-written last entry is skipped and earlier entries are kept"""
+        self.make_analyzer()._save_response("a", [])
+        with gzip.open(self.cache_path, "ab") as f:
+            f.write(b'{"key": "b", "results": [{"username": "chef_an')
+
+        self.assertEqual(self.make_analyzer()._response_cache, {"a": []})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,51 +1,90 @@
 import unittest
 import os
-import psycopg2
-from dotenv import load_dotenv
 import logging
+from pathlib import Path
+import pytest
+import vcr
 
 # Import our modules
-from instagram_pipeline.database.setup import create_database, create_tables
 from instagram_pipeline.scraper.instagram_scraper import InstagramScraper
 from instagram_pipeline.analysis.interest_analyzer import InterestAnalyzer
+from instagram_pipeline.database.helpers import prepare_statement
 
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("PipelineTest")
 
+# Instagram responses are recorded on the first run and replayed from these files afterwards
+CASSETTE_DIR = Path(__file__).parent / "cassettes"
+CASSETTES = ("test_2_user_profile.yaml", "test_3_followers.yaml", "test_4_following.yaml")
+
+# Tests that reach Instagram or GPT-4 only run when asked for; recorded cassettes let the scraping ones replay offline
+LIVE = os.getenv("INSTAGRAM_LIVE") == "1"
+REPLAY = all((CASSETTE_DIR / name).exists() for name in CASSETTES)
+live_or_replay = unittest.skipUnless(LIVE or REPLAY, "set INSTAGRAM_LIVE=1 to scrape Instagram and record cassettes")
+live_only = unittest.skipUnless(LIVE, "set INSTAGRAM_LIVE=1 to run live tests")
+
+
+def _drop_session_cookies(response):
+    """Keep the login session that served a recorded response out of the cassette"""
+    response["headers"].pop("Set-Cookie", None)
+    response["headers"].pop("set-cookie", None)
+    return response
+
+
+recorder = vcr.VCR(
+    cassette_library_dir=str(CASSETTE_DIR),
+    record_mode="once",
+    match_on=["method", "scheme", "host", "path", "query"],
+    filter_headers=["cookie", "x-csrftoken"],
+    before_record_response=_drop_session_cookies,
+    decode_compressed_response=True
+)
+
+@pytest.fixture(scope="class")
+def pipeline_components(request, db_conn, tmp_path_factory):
+    """Create the scraper and analyzer once per class, after the test database is ready"""
+    # Connect directly, so cassettes record the real Instagram responses
+    request.cls.scraper = InstagramScraper(use_proxies=False)
+    
+    # Keep the analyzer's caches in a temporary directory instead of the developer's ~/.cache
+    cache_dir = tmp_path_factory.mktemp("analyzer_cache")
+    request.cls.analyzer = InterestAnalyzer(
+        response_cache_path=cache_dir / "responses.jsonl.gz",
+        interest_cache_path=cache_dir / "interests.db"
+    )
+    
+    # Replayed responses don't need a logged-in session, so skip the Selenium login
+    if REPLAY:
+        request.cls.scraper.session_cookies = {}
+
+
+@pytest.mark.usefixtures("pipeline_components")
 class TestInstagramPipeline(unittest.TestCase):
-    @classmethod
-    def setUpClass(cls):
-        """Set up test environment once before all tests"""
-        load_dotenv()
-        
-        # Initialize database with test prefix
-        os.environ['DB_NAME'] = 'instagram_test_db'
-        create_database()
-        create_tables()
-        
-        # Get database connection
-        cls.db_conn = psycopg2.connect(
-            host=os.getenv('DB_HOST'),
-            port=os.getenv('DB_PORT'),
-            dbname=os.getenv('DB_NAME'),
-            user=os.getenv('DB_USER'),
-            password=os.getenv('DB_PASSWORD')
-        )
-        
-        # Initialize components with test database
-        cls.scraper = InstagramScraper(cls.db_conn)
-        cls.analyzer = InterestAnalyzer()
-        
-        # Test username (use a public account for testing)
-        cls.test_username = "instagram"
+    db_conn = None  # Bound to the session's test database connection by conftest
+    
+    # Test username (use a public account for testing)
+    test_username = "instagram"
     
-    @classmethod
-    def tearDownClass(cls):
-        """Clean up after all tests"""
-        if cls.db_conn:
-            cls.db_conn.close()
+    def _all_counts(self, username):
+        """Count a user's followers, following, mutuals and interests in one round trip"""
+        cursor = self.db_conn.cursor()
+        # Prepared once on the shared connection, so every verification reuses the same plan
+        prepare_statement(cursor, "count_user_rows", """
+            WITH target AS (SELECT user_id FROM users WHERE username = $1)
+            SELECT 'followers', COUNT(*) FROM followers WHERE user_id IN (SELECT user_id FROM target)
+            UNION ALL
+            SELECT 'following', COUNT(*) FROM following WHERE user_id IN (SELECT user_id FROM target)
+            UNION ALL
+            SELECT 'mutuals', COUNT(*) FROM mutuals WHERE user_id IN (SELECT user_id FROM target)
+            UNION ALL
+            SELECT 'interests', COUNT(*) FROM interests WHERE user_id IN (SELECT user_id FROM target)
+        """)
+        cursor.execute("EXECUTE count_user_rows(%s)", (username,))
+        counts = dict(cursor.fetchall())
+        cursor.close()
+        return counts
     
     def test_1_database_connection(self):
         """Test database connection"""
@@ -54,6 +93,8 @@ class TestInstagramPipeline(unittest.TestCase):
         result = cursor.fetchone()
         self.assertEqual(result[0], 1)
     
+    @live_or_replay
+    @recorder.use_cassette("test_2_user_profile.yaml")
     def test_2_user_profile_scraping(self):
         """Test user profile scraping"""
         try:
@@ -70,6 +111,8 @@ class TestInstagramPipeline(unittest.TestCase):
         except Exception as e:
             self.fail(f"Profile scraping failed with error: {str(e)}")
     
+    @live_or_replay
+    @recorder.use_cassette("test_3_followers.yaml")
     def test_3_follower_scraping(self):
         """Test follower scraping with a small limit"""
         try:
@@ -77,19 +120,15 @@ class TestInstagramPipeline(unittest.TestCase):
             self.scraper.get_followers(self.test_username, max_count=5)
             
             # Verify followers were stored in database
-            cursor = self.db_conn.cursor()
-            cursor.execute("""
-                SELECT COUNT(*) FROM followers f
-                JOIN users u ON f.user_id = u.user_id
-                WHERE u.username = %s
-            """, (self.test_username,))
-            count = cursor.fetchone()[0]
+            count = self._all_counts(self.test_username)["followers"]
             
             self.assertGreater(count, 0)
             
         except Exception as e:
             self.fail(f"Follower scraping failed with error: {str(e)}")
     
+    @live_or_replay
+    @recorder.use_cassette("test_4_following.yaml")
     def test_4_following_scraping(self):
         """Test following scraping with a small limit"""
         try:
@@ -97,57 +136,38 @@ class TestInstagramPipeline(unittest.TestCase):
             self.scraper.get_following(self.test_username, max_count=5)
             
             # Verify following were stored in database
-            cursor = self.db_conn.cursor()
-            cursor.execute("""
-                SELECT COUNT(*) FROM following f
-                JOIN users u ON f.user_id = u.user_id
-                WHERE u.username = %s
-            """, (self.test_username,))
-            count = cursor.fetchone()[0]
+            count = self._all_counts(self.test_username)["following"]
             
             self.assertGreater(count, 0)
             
         except Exception as e:
             self.fail(f"Following scraping failed with error: {str(e)}")
     
+    @live_or_replay
     def test_5_mutual_calculation(self):
         """Test mutual followers calculation"""
         try:
             self.scraper.calculate_mutual_followers(self.test_username)
             
             # Verify mutuals were calculated and stored
-            cursor = self.db_conn.cursor()
-            cursor.execute("""
-                SELECT COUNT(*) FROM mutuals m
-                JOIN users u ON m.user_id = u.user_id
-                WHERE u.username = %s
-            """, (self.test_username,))
-            count = cursor.fetchone()[0]
+            count = self._all_counts(self.test_username)["mutuals"]
             
             # We don't assert a specific count since it depends on the actual data
-            logger.info(f"Found {count} mutual followers for {self.test_username}")
+            logger.info("Found %d mutual followers for %s", count, self.test_username)
             
         except Exception as e:
             self.fail(f"Mutual calculation failed with error: {str(e)}")
     
+    @live_only
     def test_6_interest_analysis(self):
         """Test interest analysis"""
         try:
             self.analyzer.analyze_user_interests(self.test_username)
             
             # Verify interests were stored in database
-            cursor = self.db_conn.cursor()
-            cursor.execute("""
-                SELECT COUNT(*) FROM interests i
-                JOIN users u ON i.user_id = u.user_id
-                WHERE u.username = %s
-            """, (self.test_username,))
-            count = cursor.fetchone()[0]
+            count = self._all_counts(self.test_username)["interests"]
             
             self.assertGreater(count, 0)
             
         except Exception as e:
-            self.fail(f"Interest analysis failed with error: {str(e)}")
-
-if __name__ == "__main__":
-    unittest.main()
\ No newline at end of file
+            self.fail(f"Interest analysis failed with error: {str(e)}")
\ No newline at end of file
@@ -1,131 +1,134 @@
 import unittest
-import os
-import json
-import psycopg2
+import asyncio
 import logging
-from unittest.mock import patch, MagicMock
-from dotenv import load_dotenv
+import pytest
+import orjson
+from psycopg2.extras import execute_values
+from unittest.mock import patch, AsyncMock
 
 # Import modules from the pipeline
-from interest_analyzer import InterestAnalyzer
-from database_setup import create_database, create_tables
+from instagram_pipeline.analysis.interest_analyzer import InterestAnalyzer
 
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+
+# Sample GPT-4 response
+SAMPLE_GPT_RESPONSE = {
+    "results": [
+        {
+            "username": "fashionaccount",
+            "category": "Fashion",
+            "confidence": 0.95
+        },
+        {
+            "username": "techguru",
+            "category": "Technology",
+            "confidence": 0.92
+        },
+        {
+            "username": "foodlover",
+            "category": "Food",
+            "confidence": 0.9
+        }
+    ]
+}
+
+# The same response as the message content GPT-4 returns, encoded once for every mocked call
+SAMPLE_GPT_CONTENT = orjson.dumps(SAMPLE_GPT_RESPONSE).decode()
+
+
+def seed_rows(cursor, table, columns, rows, conflict_sql):
+    """Insert fixture rows with one statement"""
+    execute_values(cursor, f"""
+        INSERT INTO {table} ({", ".join(columns)})
+        VALUES %s
+        {conflict_sql}
+    """, rows)
+
+
+@pytest.fixture(scope="class")
+def analyzer_setup(request, db_conn, gpt_mock):
+    """Seed the test user and its following accounts, and create the analyzer, once per class"""
+    cls = request.cls
+    cls.gpt_mock = gpt_mock
+    cls.logger.info("Setting up test data...")
+    
+    # Set up test user and mock relationships
+    cursor = db_conn.cursor()
+    
+    # Create the test user and sample following accounts in one statement
+    following_rows = [
+        (f"following_{i}", account["username"], account["full_name"], account["bio"])
+        for i, account in enumerate(cls.sample_following_data)
+    ]
+    seed_rows(cursor, "users", ("user_id", "username", "full_name", "bio"),
+              [("12345", cls.test_username, "Test User", "This is a test user")] + following_rows,
+              "ON CONFLICT (user_id) DO NOTHING")
+    
+    # Add following relationships
+    follow_rows = [("12345", user_id) for user_id, _, _, _ in following_rows]
+    seed_rows(cursor, "following", ("user_id", "following_id"), follow_rows,
+              "ON CONFLICT (user_id, following_id) DO NOTHING")
+    
+    # Refresh planner statistics so lookups on the freshly seeded tables use their indexes
+    cursor.execute("ANALYZE users")
+    cursor.execute("ANALYZE following")
+    
+    db_conn.commit()
+    cursor.close()
+    
+    # Initialize analyzer without the local embedding model or result caches so categorization goes through GPT-4
+    cls.analyzer = InterestAnalyzer(embedding_model=None, response_cache_path=None, interest_cache_path=None)
+    
+    # Category mapping shared by the tests that only read it
+    cls.category_mapping = cls.analyzer.get_category_mapping()
+    
+    yield
+    
+    cls.logger.info("Cleaning up test resources...")
+    cls.analyzer.cleanup()
+    
+    # Remove the seeded rows and everything derived from them, so runs don't accumulate data
+    seeded_ids = ["12345"] + [user_id for user_id, _, _, _ in following_rows]
+    cursor = db_conn.cursor()
+    cursor.execute("DELETE FROM interests WHERE user_id = %s", ("12345",))
+    cursor.execute("DELETE FROM following WHERE user_id = %s", ("12345",))
+    cursor.execute("DELETE FROM users WHERE user_id = ANY(%s)", (seeded_ids,))
+    db_conn.commit()
+    cursor.close()
+
+
+@pytest.mark.usefixtures("analyzer_setup")
 class TestInterestAnalyzer(unittest.TestCase):
     """Test cases for the Interest Analyzer component"""
     
-    @classmethod
-    def setUpClass(cls):
-        """Set up test environment once before all tests"""
-        # Configure logging
-        logging.basicConfig(level=logging.INFO)
-        cls.logger = logging.getLogger("AnalyzerTest")
-        
-        # Load environment variables
-        load_dotenv()
-        
-        # Use test database
-        os.environ['DB_NAME'] = 'instagram_test_db'
-        
-        # Initialize database with test prefix
-        cls.logger.info("Setting up test database...")
-        create_database()
-        create_tables()
-        
-        # Get database connection
-        cls.db_conn = psycopg2.connect(
-            host=os.getenv('DB_HOST'),
-            port=os.getenv('DB_PORT'),
-            dbname=os.getenv('DB_NAME'),
-            user=os.getenv('DB_USER'),
-            password=os.getenv('DB_PASSWORD')
-        )
-        
-        # Sample following data (used for mocking)
-        cls.sample_following_data = [
-            {
-                "username": "fashionaccount",
-                "full_name": "Fashion Blogger",
-                "bio": "Fashion enthusiast. Sharing daily fashion tips and trends."
-            },
-            {
-                "username": "techguru",
-                "full_name": "Tech Expert",
-                "bio": "Software engineer. AI enthusiast. Sharing tech news and tutorials."
-            },
-            {
-                "username": "foodlover",
-                "full_name": "Chef Michael",
-                "bio": "Professional chef. Sharing recipes and food photography."
-            }
-        ]
-        
-        # Sample GPT-4 response
-        cls.sample_gpt_response = {
-            "results": [
-                {
-                    "username": "fashionaccount",
-                    "category": "Fashion",
-                    "confidence": 0.95
-                },
-                {
-                    "username": "techguru",
-                    "category": "Technology",
-                    "confidence": 0.92
-                },
-                {
-                    "username": "foodlover",
-                    "category": "Food",
-                    "confidence": 0.9
-                }
-            ]
+    logger = logging.getLogger("AnalyzerTest")
+    db_conn = None  # Bound to the session's test database connection by conftest
+    
+    # Sample following data (used for mocking)
+    sample_following_data = [
+        {
+            "username": "fashionaccount",
+            "full_name": "Fashion Blogger",
+            "bio": "Fashion enthusiast. Sharing daily fashion tips and trends."
+        },
+        {
+            "username": "techguru",
+            "full_name": "Tech Expert",
+            "bio": "Software engineer. AI enthusiast. Sharing tech news and tutorials."
+        },
+        {
+            "username": "foodlover",
+            "full_name": "Chef Michael",
+            "bio": "Professional chef. Sharing recipes and food photography."
         }
-        
-        # Test username (should exist in the test database)
-        cls.test_username = "instagram"
-        
-        # Set up test user and mock relationships
-        cursor = cls.db_conn.cursor()
-        
-        # Create test user if doesn't exist
-        cursor.execute("""
-            INSERT INTO users (user_id, username, full_name, bio)
-            VALUES (%s, %s, %s, %s)
-            ON CONFLICT (user_id) DO NOTHING
-        """, ("12345", cls.test_username, "Test User", "This is a test user"))
-        
-        # Create sample following accounts
-        for i, account in enumerate(cls.sample_following_data):
-            cursor.execute("""
-                INSERT INTO users (user_id, username, full_name, bio)
-                VALUES (%s, %s, %s, %s)
-                ON CONFLICT (user_id) DO NOTHING
-            """, (
-                f"following_{i}", 
-                account["username"], 
-                account["full_name"],
-                account["bio"]
-            ))
-            
-            # Add following relationship
-            cursor.execute("""
-                INSERT INTO following (user_id, following_id)
-                VALUES (%s, %s)
-                ON CONFLICT (user_id, following_id) DO NOTHING
-            """, ("12345", f"following_{i}"))
-        
-        cls.db_conn.commit()
-        cursor.close()
-        
-        # Initialize analyzer
-        cls.analyzer = InterestAnalyzer()
+    ]
+    
+    # Sample GPT-4 response
+    sample_gpt_response = SAMPLE_GPT_RESPONSE
     
-    @classmethod
-    def tearDownClass(cls):
-        """Clean up after all tests"""
-        cls.logger.info("Cleaning up test resources...")
-        cls.analyzer.cleanup()
-        if cls.db_conn:
-            cls.db_conn.close()
+    # Test username (should exist in the test database)
+    test_username = "instagram"
     
     def setUp(self):
         """Setup before each test"""
@@ -135,6 +138,14 @@ class TestInterestAnalyzer(unittest.TestCase):
         """Cleanup after each test"""
         if self.cursor:
             self.cursor.close()
+        # Discard anything the test left uncommitted, including a transaction aborted by a failed statement
+        self.db_conn.rollback()
+    
+    def _delete_job(self, job_id):
+        """Remove a scrape job created by a test"""
+        with self.db_conn.cursor() as cursor:
+            cursor.execute("DELETE FROM scrape_jobs WHERE job_id = %s", (job_id,))
+        self.db_conn.commit()
     
     def test_01_interest_categories_setup(self):
         """Test that interest categories are set up correctly"""
@@ -156,13 +167,13 @@ class TestInterestAnalyzer(unittest.TestCase):
         sub_category_count = self.cursor.fetchone()[0]
         self.assertGreater(sub_category_count, 3, "Not enough subcategories found")
         
-        self.logger.info(f"Found {main_category_count} main categories and {sub_category_count} subcategories")
+        self.logger.info("Found %d main categories and %d subcategories", main_category_count, sub_category_count)
     
     def test_02_get_category_mapping(self):
         """Test category mapping retrieval"""
         self.logger.info("Testing category mapping")
         
-        category_mapping = self.analyzer.get_category_mapping()
+        category_mapping = self.category_mapping
         
         # Verify mapping has content
         self.assertIsNotNone(category_mapping, "Category mapping is None")
@@ -173,11 +184,11 @@ class TestInterestAnalyzer(unittest.TestCase):
         for category in expected_categories:
             self.assertIn(category, category_mapping, f"Category '{category}' not found in mapping")
         
-        self.logger.info(f"Category mapping has {len(category_mapping)} entries")
+        self.logger.info("Category mapping has %d entries", len(category_mapping))
     
     def test_03_get_following_data(self):
         """Test retrieval of following data"""
-        self.logger.info(f"Testing following data retrieval for {self.test_username}")
+        self.logger.info("Testing following data retrieval for %s", self.test_username)
         
         # Get user ID for test username
         self.cursor.execute("SELECT user_id FROM users WHERE username = %s", (self.test_username,))
@@ -195,58 +206,44 @@ class TestInterestAnalyzer(unittest.TestCase):
             self.assertIn("username", account, "Username missing in following data")
             self.assertIn("full_name", account, "Full name missing in following data")
         
-        self.logger.info(f"Found {len(following_data)} following accounts")
+        self.logger.info("Found %d following accounts", len(following_data))
     
-    @patch('openai.OpenAI')
-    def test_04_analyze_user_interests(self, mock_openai):
+    def test_04_analyze_user_interests(self):
         """Test interest analysis with mock GPT response"""
-        self.logger.info(f"Testing interest analysis for {self.test_username}")
-        
-        # Configure mock
-        mock_client = MagicMock()
-        mock_openai.return_value = mock_client
-        
-        mock_response = MagicMock()
-        mock_choice = MagicMock()
-        mock_message = MagicMock()
-        mock_message.content = json.dumps(self.sample_gpt_response)
-        mock_choice.message = mock_message
-        mock_response.choices = [mock_choice]
+        self.logger.info("Testing interest analysis for %s", self.test_username)
         
-        mock_client.chat.completions.create.return_value = mock_response
+        # Override the analyzer's OpenAI client with the pre-wired mock
+        create = self.gpt_mock.chat.completions.with_raw_response.create
+        create.reset_mock()
+        self.analyzer.client = self.gpt_mock
         
-        # Override the analyzer's OpenAI client with our mock
-        self.analyzer.client = mock_client
+        # Clear cached categorizations so the sample accounts go through GPT-4
+        self.cursor.execute("DELETE FROM account_categorization_cache")
+        self.db_conn.commit()
         
         # Run interest analysis
         self.analyzer.analyze_user_interests(self.test_username)
         
         # Verify GPT-4 was called
-        mock_client.chat.completions.create.assert_called()
+        create.assert_called()
         
-        # Verify interests were stored in database
+        # Fetch the stored interests and their confidence per category in one query
         self.cursor.execute("""
-            SELECT COUNT(*) FROM interests i
+            SELECT COUNT(*),
+                   COALESCE(jsonb_object_agg(ic.category_name, i.confidence_score)
+                            FILTER (WHERE ic.category_name IS NOT NULL), '{}')
+            FROM interests i
             JOIN users u ON i.user_id = u.user_id
+            LEFT JOIN interest_categories ic ON i.category_id = ic.category_id
             WHERE u.username = %s
         """, (self.test_username,))
-        interest_count = self.cursor.fetchone()[0]
+        interest_count, interest_dict = self.cursor.fetchone()
         
+        # Verify interests were stored in database
         self.assertGreater(interest_count, 0, "No interests were stored in database")
-        self.logger.info(f"Found {interest_count} interests in database")
+        self.logger.info("Found %d interests in database", interest_count)
         
         # Check specific interests
-        self.cursor.execute("""
-            SELECT ic.category_name, i.confidence_score
-            FROM interests i
-            JOIN users u ON i.user_id = u.user_id
-            JOIN interest_categories ic ON i.category_id = ic.category_id
-            WHERE u.username = %s
-        """, (self.test_username,))
-        
-        interests = self.cursor.fetchall()
-        interest_dict = {row[0]: row[1] for row in interests}
-        
         for result in self.sample_gpt_response["results"]:
             category = result["category"]
             if category in interest_dict:
@@ -262,7 +259,7 @@ class TestInterestAnalyzer(unittest.TestCase):
         self.logger.info("Testing batch prompt creation")
         
         # Get available categories
-        categories = list(self.analyzer.get_category_mapping().keys())
+        categories = list(self.category_mapping.keys())
         
         # Create a batch prompt
         prompt = self.analyzer._create_batch_prompt(self.sample_following_data, categories)
@@ -285,9 +282,11 @@ class TestInterestAnalyzer(unittest.TestCase):
         self.cursor.execute("""
             INSERT INTO scrape_jobs (target_username, job_type, status, started_at, completed_at)
             VALUES (%s, %s, %s, NOW(), NOW())
-            ON CONFLICT DO NOTHING
+            RETURNING job_id
         """, (self.test_username, 'following', 'completed'))
+        job_id = self.cursor.fetchone()[0]
         self.db_conn.commit()
+        self.addCleanup(self._delete_job, job_id)
         
         # Clear existing interests to ensure our user needs analysis
         self.cursor.execute("""
@@ -297,10 +296,10 @@ class TestInterestAnalyzer(unittest.TestCase):
         """, (self.test_username,))
         self.db_conn.commit()
         
-        # Mock the analyze_user_interests method
-        with patch.object(self.analyzer, 'analyze_user_interests') as mock_analyze:
+        # Mock the analyze_user_interests_async method
+        with patch.object(self.analyzer, 'analyze_user_interests_async', new_callable=AsyncMock) as mock_analyze:
             # Run the process
-            self.analyzer.process_pending_users()
+            asyncio.run(self.analyzer.process_pending_users_async())
             
             # Check if our user was processed
             mock_analyze.assert_called()
@@ -315,7 +314,4 @@ class TestInterestAnalyzer(unittest.TestCase):
             
             self.assertTrue(processed, f"Test user {self.test_username} was not processed")
         
-        self.logger.info("Pending users processing verified")
-
-if __name__ == "__main__":
-    unittest.main()
\ No newline at end of file
+        self.logger.info("Pending users processing verified")
\ No newline at end of file
@@ -0,0 +1,122 @@
+import os
+import unittest
+import asyncio
+from collections import deque
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from instagram_pipeline.scraper import token_bucket
+from instagram_pipeline.scraper.token_bucket import TokenBucket, get_bucket
+from instagram_pipeline.scraper.proxy_manager import ProxyManager
+
+
+class FakeClock:
+    """Monotonic clock that only moves when told to, or when the code under test sleeps"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestTokenBucket(unittest.TestCase):
+    """Test cases for the shared Instagram request budget"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = patch.multiple(token_bucket, time=self.clock, asyncio=SimpleNamespace(sleep=self.clock.sleep))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst_then_wait(self):
+        """Test that a full bucket allows a burst and then reports the wait for the next token"""
+        bucket = TokenBucket(rate=2, burst=3)
+
+        self.assertEqual([bucket._take() for _ in range(3)], [0.0, 0.0, 0.0])
+        self.assertAlmostEqual(bucket._take(), 0.5)
+
+    def test_refill_is_capped_at_burst(self):
+        """Test that idle time refills tokens at the rate but never beyond the burst"""
+        bucket = TokenBucket(rate=2, burst=3)
+        for _ in range(3):
+            bucket._take()
+
+        self.clock.now += 1
+        self.assertEqual(bucket._take(), 0.0)
+        self.assertAlmostEqual(bucket.tokens, 1.0)
+
+        self.clock.now += 100
+        bucket._take()
+        self.assertAlmostEqual(bucket.tokens, 2.0)
+
+    def test_acquire_waits_for_refill(self):
+        """Test that acquire sleeps just long enough for one token once the burst is spent"""
+        bucket = TokenBucket(rate=4, burst=1)
+
+        asyncio.run(bucket.acquire())
+        asyncio.run(bucket.acquire())
+
+        self.assertEqual(len(self.clock.sleeps), 1)
+        self.assertAlmostEqual(self.clock.sleeps[0], 0.25)
+        self.assertAlmostEqual(bucket.tokens, 0.0)
+
+    def test_buckets_are_shared_per_proxy(self):
+        """Test that clients using the same proxy share one bucket"""
+        self.assertIs(get_bucket("http://proxy-a:8080"), get_bucket("http://proxy-a:8080"))
+        self.assertIsNot(get_bucket("http://proxy-a:8080"), get_bucket("http://proxy-b:8080"))
+
+
+class TestProxyManager(unittest.TestCase):
+    """Test cases for proxy rotation"""
+
+    def setUp(self):
+        self.manager = ProxyManager()
+        self.pool = [{"http": f"http://proxy{i}:port", "https": f"https://proxy{i}:port"} for i in range(4)]
+        self.manager.proxies = deque(self.pool)
+        self.manager.configured = True
+
+    def test_rotation_order(self):
+        """Test that proxies are handed out round-robin"""
+        picked = [self.manager.get_proxy() for _ in range(6)]
+
+        self.assertEqual(picked, self.pool + self.pool[:2])
+
+    def test_failed_proxy_is_removed(self):
+        """Test that a proxy leaves the rotation only after max_failures failures"""
+        bad = self.pool[1]
+        for _ in range(ProxyManager.max_failures - 1):
+            self.manager.mark_proxy_failed(bad)
+        self.assertIn(bad, self.manager.proxies)
+
+        self.manager.mark_proxy_failed(bad)
+
+        self.assertNotIn(bad, self.manager.proxies)
+        self.assertNotIn(bad["https"], self.manager.fail_counts)
+        picked = [self.manager.get_proxy() for _ in range(3)]
+        self.assertEqual(sorted(p["https"] for p in picked), sorted(p["https"] for p in self.pool if p is not bad))
+
+    def test_proxies_come_from_settings(self):
+        """Test that only configured proxies are loaded, and none means direct connections"""
+        with patch.dict(os.environ, {"PROXY_URLS": "http://a:8080, http://b:8080"}):
+            self.assertEqual(sorted(p["http"] for p in ProxyManager().proxies), ["http://a:8080", "http://b:8080"])
+        with patch.dict(os.environ, {"PROXY_URLS": ""}):
+            self.assertIsNone(ProxyManager().get_proxy())
+
+    def test_exhausted_pool_raises(self):
+        """Test that losing every configured proxy is an error rather than a silent reload or direct connection"""
+        for proxy in self.pool:
+            for _ in range(ProxyManager.max_failures):
+                self.manager.mark_proxy_failed(proxy)
+
+        with self.assertRaises(RuntimeError):
+            self.manager.get_proxy()
+
+
+if __name__ == "__main__":
+    unittest.main()